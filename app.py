@@ -1,188 +1,56 @@
 
+import tempfile
+
 import pandas as pd
-from datetime import datetime, timedelta
 import streamlit as st
-import io
-from fpdf import FPDF
+from cache import ParseCache, ArtifactCache, PRESUPUESTO_ARCHIVOS_MB, PRESUPUESTO_DESCARGAS_MB
+from ingesta import IngestaError
+from instrumentacion import Instrumentacion, configurar_log
+from pipeline import (
+    procesar, fecha_actual, exportar_excel, exportar_pdf, guardar_historial, huella_entradas, ETAPAS_PROCESAR, NOMBRE_XLSX, NOMBRE_PDF
+)
+from proyeccion_saldos import Horizonte, proyectar
+from reporte import COLUMNAS_A_CUBRIR, buckets_columna
+from backtesting import backtest, totales_por_fecha
+from simulacion import simular
+from conciliacion import conciliar
+from consultas import CONSULTAS, ejecutar
+from historial import cambios, fechas_guardadas, tendencia
+from trabajos import Trabajo
 
 # ==========================================
 # PARTE 1: PROCESAMIENTO DE DATOS
 # ==========================================
 
-fecha_hoy = pd.to_datetime(datetime.now().date())
+# Evaluated on every rerun (Streamlit re-executes this script), so it never goes stale
+fecha_hoy = fecha_actual()
 # fecha_hoy = pd.to_datetime('2025-12-02') # Descomentar para probar con fecha fija
 
-# Data de correlación incrustada directamente
-data_nombres = {
-    'Cheques': [
-        'BBVA FRANCES BYC', 'BBVA FRANCES MPZ', 'BBVA FRANCES MBZ', 'BBVA FRANCES MGX',
-        'BBVA FRANCES RG2', 'CREDICOOP BYC', 'CREDICOOP MGX', 'CREDICOOP MBZ',
-        'CREDICOOP TMX', 'DE LA NACION ARG. BYC', 'DE LA NACION ARG MGX',
-        'PATAGONIA MBZ', 'SANTANDER RIO BYC', 'SANTANDER RIO MBZ',
-        'SANTANDER MGXD', 'MERCADO PAGO BYC', 'MERCADO PAGO MGX', 'MERCADO PAGO MBZ'
-    ],
-    'Proyeccion Pagos': [
-        'Bco BBVA BYC SA', 'Bco BBVA MPZ BYC SA', 'Bco BBVA MBZ SRL', 'Bco BBVA MGXD SRL',
-        'Bco BBVA RG2', 'Bco Credicoop BYC SA', 'Bco Credicoop MGXD SRL', 'Bco Credicoop MBZ SRL',
-        'Bco Credicoop TMX SRL', 'Bco Nacion BYC SA', 'Bco Nacion MGXD SRL',
-        'Bco Patagonia MBZ SRL', 'Bco Santander BYC SA', 'Bco Santander MBZ SRL',
-        'Bco Santander MGXD SRL', 'MercadoPago BYC', 'MercadoPago MGX', 'MercadoPago MBZ'
-    ],
-    'EMPRESA': [
-        'BYC', 'BYC', 'MBZ', 'MGX',
-        'BYC', 'BYC', 'MGX', 'MBZ',
-        'TMX', 'BYC', 'MGX',
-        'MBZ', 'BYC', 'MBZ',
-        'MGX', 'BYC', 'MGX', 'MBZ'
-    ]
-}
-nombres_df = pd.DataFrame(data_nombres)
-
-# Create a robust mapping dictionary from nombres_df
-bank_mapping_dict = {}
-for idx, row in nombres_df.iterrows():
-    canonical_banco = row['Proyeccion Pagos'].strip() # Assume this is the canonical name
-    empresa = row['EMPRESA'].strip()
-
-    # Map from Cheques name to (canonical_banco, empresa)
-    raw_cheque_name = row['Cheques'].strip()
-    bank_mapping_dict[raw_cheque_name] = (canonical_banco, empresa)
-
-    # Map from Proyeccion Pagos name to (canonical_banco, empresa)
-    bank_mapping_dict[canonical_banco] = (canonical_banco, empresa)
-
-# Function to apply the mapping consistently
-def apply_bank_mapping(raw_bank_name):
-    mapped_info = bank_mapping_dict.get(raw_bank_name.strip())
-    if mapped_info:
-        return mapped_info[0], mapped_info[1] # Banco_Limpio, Empresa
-    return raw_bank_name, 'UNKNOWN' # Fallback if no match is found
-
-def procesar_archivo(file_object_or_path, col_banco, col_fecha, col_importe, tipo_origen, nombres_map_df, col_detalle=None, col_numero_cheque=None):
-    df = pd.read_excel(file_object_or_path)
-
-    # NEW CONDITIONAL FILTER: Only for 'Proyeccion' files, filter where column H (index 7) is empty
-    if tipo_origen == 'Proyeccion':
-        df = df[df.iloc[:, 7].isnull()].copy() # Filter rows where column H is NaN
-
-    df_clean = pd.DataFrame({
-        'Banco_Raw': df.iloc[:, col_banco].astype(str).str.strip(),
-        'Fecha': pd.to_datetime(df.iloc[:, col_fecha], errors='coerce'),
-        'Importe': pd.to_numeric(df.iloc[:, col_importe], errors='coerce'),
-        'Origen': tipo_origen
-    })
-    # Drop rows where 'Importe', 'Banco_Raw', or 'Fecha' are NaN (after coercion)
-    df_clean = df_clean.dropna(subset=['Importe', 'Banco_Raw', 'Fecha'])
-
-    if col_detalle is not None:
-        df_clean['Detalle'] = df.iloc[:, col_detalle].astype(str).str.strip()
-    else:
-        df_clean['Detalle'] = '' # Default empty string if no detail column
-
-    if col_numero_cheque is not None:
-        df_clean['Numero_Cheque'] = df.iloc[:, col_numero_cheque].astype(str).str.strip()
-    else:
-        df_clean['Numero_Cheque'] = '' # Default empty string if no cheque number column
-
-    # Apply the centralized mapping
-    df_clean[['Banco_Limpio', 'Empresa']] = df_clean['Banco_Raw'].apply(lambda x: pd.Series(apply_bank_mapping(x)))
-
-    return df_clean
-
-def procesar_archivo_impuestos(file_object_or_path):
-    df = pd.read_excel(file_object_or_path)
-
-    # Extract data from specified columns
-    df_impuestos_clean = pd.DataFrame({
-        'Empresa_Raw': df.iloc[:, 2].astype(str).str.strip(), # Column C
-        'Fecha': pd.to_datetime(df.iloc[:, 5], errors='coerce'), # Column F
-        'Importe': pd.to_numeric(df.iloc[:, 6], errors='coerce'), # Column G
-        'Estado': df.iloc[:, 11].astype(str).str.strip(), # Column L
-        'Detalle': df.iloc[:, 1].astype(str).str.strip() # Column B for Detalle
-    })
-
-    # Filter based on 'Estado'
-    df_impuestos_clean = df_impuestos_clean[df_impuestos_clean['Estado'].isin(['VENCIDO', 'A PAGAR'])].copy()
-
-    # Convert 'Importe' to numeric
-    # df_impuestos_clean['Importe'] = df_impuestos_clean['Importe'] * -1 # REMOVED: User wants positive sign
-
-    # Add 'Origen' column
-    df_impuestos_clean['Origen'] = 'Impuestos'
-
-    # Add empty 'Numero_Cheque' column for consistency
-    df_impuestos_clean['Numero_Cheque'] = ''
-
-    # Create mapping from nombres_df for 'Empresa' to 'Banco_Limpio'
-    # Group by 'EMPRESA' and take the first 'Proyeccion Pagos' as the default 'Banco_Limpio'%
-    empresa_to_default_bank = nombres_df.groupby('EMPRESA')['Proyeccion Pagos'].first().to_dict()
-
-    # Apply mapping to create 'Banco_Limpio' and handle 'UNKNOWN'
-    df_impuestos_clean['Banco_Limpio'] = df_impuestos_clean['Empresa_Raw'].map(empresa_to_default_bank)
-    df_impuestos_clean['Banco_Limpio'] = df_impuestos_clean['Banco_Limpio'].fillna('UNKNOWN')
-
-    # Rename Empresa_Raw to Empresa for consistency and select final columns
-    df_impuestos_clean = df_impuestos_clean.rename(columns={'Empresa_Raw': 'Empresa'})
-    df_impuestos_clean = df_impuestos_clean[['Empresa', 'Banco_Limpio', 'Fecha', 'Importe', 'Origen', 'Detalle', 'Numero_Cheque']]
-    df_impuestos_clean = df_impuestos_clean.dropna(subset=['Importe', 'Empresa', 'Banco_Limpio', 'Fecha'])
-
-    return df_impuestos_clean
-
-# NEW FUNCTION FOR SALDOS CAJAS
-def procesar_archivo_cajas(file_object_or_path):
-    # Read the Excel file, skipping the first 6 rows (header is at row 7, which is index 6)
-    df = pd.read_excel(file_object_or_path, header=6)
-
-    # Create a new DataFrame from the relevant columns (B and D, original indices 1 and 3)
-    df_cajas_clean = pd.DataFrame({
-        'Nombre_Caja': df.iloc[:, 1].astype(str).str.strip(),        # Original Column B
-        'Saldo_Caja': pd.to_numeric(df.iloc[:, 3], errors='coerce')  # Original Column D
-    })
-
-    # Define the list of allowed box names (instead of numbers)
-    allowed_box_names = [
-        'TESORERIA',
-        'SMT - ENCARGADO',
-        'MPZ ENCARGADO',
-        'AKN - ENCARGADO',
-        'ZT2 - ENCARGADO',
-        'BRC - ENCARGADO',
-        'BR2 - ENCARGADO',
-        'RGL - ENCARGADO',
-        'RG2 - ENCARGADO',
-        'RESERVA'
-    ]
-
-    # Filter the DataFrame to include only allowed box names and drop NaN 'Saldo_Caja' values
-    df_cajas_clean = df_cajas_clean[
-        df_cajas_clean['Nombre_Caja'].isin(allowed_box_names)
-    ].dropna(subset=['Saldo_Caja']).copy()
-
-    # Order the DataFrame by the specified list of box names
-    df_cajas_clean['Nombre_Caja'] = pd.Categorical(df_cajas_clean['Nombre_Caja'], categories=allowed_box_names, ordered=True)
-    df_cajas_clean = df_cajas_clean.sort_values('Nombre_Caja')
-
-    # Transform df_cajas_clean to match the desired schema
-    df_cajas_output = pd.DataFrame({
-        'CAJA': df_cajas_clean['Nombre_Caja'], # Renamed to CAJA
-        'Empresa': df_cajas_clean['Nombre_Caja'], # Defaulting Empresa to Caja Name for now
-        'Banco_Limpio': 'Caja ' + df_cajas_clean['Nombre_Caja'], # Consistent naming
-        'Fecha': fecha_hoy,
-        'Importe': df_cajas_clean['Saldo_Caja'],
-        'Origen': 'Caja',
-        'Detalle': df_cajas_clean['Nombre_Caja'], # Using Caja Name as Detalle
-        'Numero_Cheque': ''
-    })
-
-    # Select and reorder columns for final output, ensuring 'CAJA' is the primary identifier
-    df_cajas_output = df_cajas_output[['CAJA', 'Empresa', 'Banco_Limpio', 'Fecha', 'Importe', 'Origen', 'Detalle', 'Numero_Cheque']]
-
-    return df_cajas_output
+# Stage timings go to the server log as JSON lines
+configurar_log()
+
+
+@st.cache_resource
+def caches_compartidas():
+    # One instance per server process, shared by every session: parsed frames and each source's
+    # share of the report (keyed by file content, plus the date for the shares), and the
+    # downloads (keyed by the fingerprint of the inputs and the date)
+    return (
+        ParseCache(max_entries=256, max_bytes=PRESUPUESTO_ARCHIVOS_MB * 2**20),
+        ArtifactCache(max_entries=64, max_bytes=PRESUPUESTO_DESCARGAS_MB * 2**20),
+    )
+
 
 # ========================================== Streamlit UI ==========================================
 st.title("Generador de Reporte de Cashflow")
 st.write("Sube tus archivos de Excel para generar un reporte detallado.")
 
+with st.sidebar:
+    st.header("Rendimiento")
+    mostrar_metricas = st.checkbox("Mostrar tiempos por etapa", key="mostrar_metricas")
+    medir_memoria = st.checkbox("Medir memoria (tracemalloc, más lento)", key="medir_memoria")
+    perfilar = st.checkbox("Perfilar cada ejecución (cProfile)", key="perfilar")
+
 # Cargadores de archivos en la página principal
 st.header("Cargar Archivos")
 uploaded_file_proyeccion = st.file_uploader(
@@ -212,649 +80,294 @@ uploaded_file_cajas = st.file_uploader(
 )
 
 if uploaded_file_proyeccion is not None and uploaded_file_cheques is not None and uploaded_file_saldos is not None and uploaded_file_impuestos is not None and uploaded_file_cajas is not None:
-    with st.spinner('Procesando datos y generando reporte...'):
-        # Add xlsxwriter version check
-        try:
-            import xlsxwriter
-            # st.write(f"XlsxWriter version: {xlsxwriter.__version__}") # Removed as not resolving issue
-        except ImportError:
-            st.error("Error: xlsxwriter library not found. Please ensure it's installed and redeploy.")
-        except AttributeError:
-            st.error("Error: Cannot determine xlsxwriter version.")
-
-        archivo_proyeccion_io = io.BytesIO(uploaded_file_proyeccion.getvalue())
-        archivo_cheques_io = io.BytesIO(uploaded_file_cheques.getvalue())
-        archivo_saldos_io = io.BytesIO(uploaded_file_saldos.getvalue())
-        archivo_impuestos_io = io.BytesIO(uploaded_file_impuestos.getvalue())
-        archivo_cajas_io = io.BytesIO(uploaded_file_cajas.getvalue())
-
-        df_proy = procesar_archivo(archivo_proyeccion_io, 0, 2, 9, 'Proyeccion', nombres_df, col_detalle=6)
-        df_cheq = procesar_archivo(archivo_cheques_io, 3, 1, 14, 'Cheques', nombres_df, col_detalle=10, col_numero_cheque=2)
-        df_impuestos = procesar_archivo_impuestos(archivo_impuestos_io)
-        df_cajas = procesar_archivo_cajas(archivo_cajas_io)
-
-        # Create df_total from the three processed dataframes
-        df_total = pd.concat([df_proy, df_cheq, df_impuestos, df_cajas])
-
-        # Create df_pivot_base for future payments
-        # Exclude 'Caja' origin from df_pivot_base
-        df_pivot_base = df_total[(df_total['Fecha'] >= fecha_hoy) & (df_total['Origen'] != 'Caja')].copy()
-        df_pivot_base = df_pivot_base[['Empresa', 'Banco_Limpio', 'Fecha', 'Importe', 'Origen', 'Detalle', 'Numero_Cheque']]
-
-        # Cargar saldos iniciales del archivo Saldos.xlsx
-        df_saldos = pd.read_excel(archivo_saldos_io)
-
-        # Map original column indices to new names as per instruction
-        df_saldos_clean = pd.DataFrame({
-            'Banco_Raw_Saldos': df_saldos.iloc[:, 0].astype(str).str.strip(), # Column A for Banco
-            'Saldo FCI': pd.to_numeric(df_saldos.iloc[:, 1], errors='coerce'),  # Column B for Saldo FCI
-            'Saldo Banco': pd.to_numeric(df_saldos.iloc[:, 2], errors='coerce')  # Column C for Saldo Banco
-        })
-        df_saldos_clean = df_saldos_clean.dropna(subset=['Saldo FCI', 'Saldo Banco'])
-
-        # Apply the centralized mapping to saldos data
-        df_saldos_clean[['Banco_Limpio', 'Empresa']] = df_saldos_clean['Banco_Raw_Saldos'].apply(lambda x: pd.Series(apply_bank_mapping(x)))
-
-        df_saldos_clean = df_saldos_clean[['Empresa', 'Banco_Limpio', 'Saldo FCI', 'Saldo Banco']].drop_duplicates()
-        df_saldos_clean = df_saldos_clean.set_index(['Empresa', 'Banco_Limpio'])
-
-        # Periodos
-        fecha_limite_semana = fecha_hoy + timedelta(days=5)
-
-        # 1. Vencido
-        filtro_vencido = df_total['Fecha'] < fecha_hoy
-        df_vencido = df_total[filtro_vencido].groupby(['Empresa', 'Banco_Limpio'])[['Importe']].sum()
-        df_vencido.columns = ['Vencido']
-
-        # 2. Semana (Días)
-        filtro_semana = (df_total['Fecha'] >= fecha_hoy) & (df_total['Fecha'] <= fecha_limite_semana)
-        df_semana_data = df_total[filtro_semana].copy()
-        dias_es_full = {0:'Lunes', 1:'Martes', 2:'Miércoles', 3:'Jueves', 4:'Viernes', 5:'Sábado', 6:'Domingo'}
-
-        expected_day_columns = []
-        for i in range(6):
-            current_date = fecha_hoy + timedelta(days=i)
-            expected_day_columns.append(f"{current_date.strftime('%d-%b')}\n{dias_es_full[current_date.weekday()]}")
-
-        df_semana_data['Nombre_Dia'] = df_semana_data['Fecha'].apply(lambda x: f"{x.strftime('%d-%b')}\n{dias_es_full[x.weekday()]}")
-
-        df_semana_pivot = pd.pivot_table(
-            df_semana_data, index=['Empresa', 'Banco_Limpio'], columns='Nombre_Dia', values='Importe', aggfunc='sum', fill_value=0
+    # Add xlsxwriter version check
+    try:
+        import xlsxwriter
+        # st.write(f"XlsxWriter version: {xlsxwriter.__version__}") # Removed as not resolving issue
+    except ImportError:
+        st.error("Error: xlsxwriter library not found. Please ensure it's installed and redeploy.")
+    except AttributeError:
+        st.error("Error: Cannot determine xlsxwriter version.")
+
+    # Parsed frames are cached on the upload bytes + column spec, so reruns triggered by widgets
+    # don't go back to openpyxl, and each source's share of the report too, so re-uploading one
+    # file only re-aggregates that file. Downloads are kept by the fingerprint of the files and
+    # the date. Both caches are shared with the other sessions.
+    parse_cache, export_cache = caches_compartidas()
+
+    contenidos = {
+        'Proyeccion': uploaded_file_proyeccion.getvalue(),
+        'Cheques': uploaded_file_cheques.getvalue(),
+        'Impuestos': uploaded_file_impuestos.getvalue(),
+        'Cajas': uploaded_file_cajas.getvalue(),
+        'Saldos': uploaded_file_saldos.getvalue(),
+    }
+
+    def generar_reporte(instrumentacion):
+        # Runs in a background job: the report and its entry in the history; the downloads are
+        # only rendered when they are requested
+        resultado = procesar(contenidos, fecha_hoy, cache=parse_cache, instrumentacion=instrumentacion,
+                             cache_agregados=parse_cache)
+        guardar_historial(resultado)
+        return resultado
+
+    # The job lives in the session and is only replaced when the inputs, the date or the
+    # measuring options change, so reruns while it runs just show its progress
+    clave_trabajo = (huella_entradas(contenidos, fecha_hoy), medir_memoria, perfilar)
+    trabajo = st.session_state.get('trabajo')
+    if trabajo is None or trabajo.clave != clave_trabajo:
+        if trabajo is not None:
+            trabajo.cancelar()
+        trabajo = Trabajo(generar_reporte, Instrumentacion(memoria=medir_memoria, perfil=perfilar),
+                          (*ETAPAS_PROCESAR, 'historial'), clave=clave_trabajo)
+        st.session_state['trabajo'] = trabajo
+
+    if not trabajo.terminado:
+        @st.fragment(run_every=0.5)
+        def mostrar_progreso():
+            if trabajo.terminado:
+                st.rerun()
+            etapa_actual = trabajo.etapa_actual or trabajo.estado
+            st.progress(trabajo.progreso, text=f"Procesando datos y generando reporte... ({etapa_actual})")
+            if st.button("Cancelar", key="cancelar_trabajo"):
+                trabajo.cancelar()
+
+        mostrar_progreso()
+        st.stop()
+
+    if trabajo.estado == 'cancelado':
+        st.warning("Se canceló la generación del reporte.")
+        if st.button("Volver a generar", key="reintentar_trabajo"):
+            del st.session_state['trabajo']
+            st.rerun()
+        st.stop()
+
+    try:
+        resultado = trabajo.resultado()
+    except IngestaError as e:
+        for archivo, exc in e.errores.items():
+            st.error(f"Error al procesar el archivo {archivo}: {exc}")
+        st.stop()
+    except Exception as e:
+        # Any other failure: the job keeps its key, so it has to be dropped to run it again
+        st.error(f"Error al generar el reporte: {type(e).__name__}: {e}")
+        if st.button("Volver a generar", key="reintentar_trabajo_error"):
+            del st.session_state['trabajo']
+            st.rerun()
+        st.stop()
+
+    # Stages of this rerun (projection, backtesting, ...); the job's are in resultado.instrumentacion
+    metricas = Instrumentacion(memoria=medir_memoria)
+
+    reporte_final = resultado.reporte_final
+    df_cajas = resultado.df_cajas
+
+    # ========================================== Streamlit Output ==========================================
+    st.subheader("Reporte de Cashflow Generado")
+
+    def reiniciar_pagina_desglose():
+        st.session_state['desglose_pagina'] = 1
+
+    # Selecting a cell lists the movements behind it, a page at a time, from the index built
+    # while the report was aggregated
+    seleccion_reporte = st.dataframe(
+        reporte_final, on_select=reiniciar_pagina_desglose, selection_mode='single-cell', key="reporte_celda"
+    )
+    if seleccion_reporte.selection.cells:
+        posicion, columna = seleccion_reporte.selection.cells[0]
+        empresa, banco = reporte_final.index[posicion]
+        nombre_columna = columna.replace('\n', ' ')
+        if not buckets_columna(columna, resultado.fecha_hoy):
+            st.caption(f"{nombre_columna} de {banco} sale de Saldos.xlsx, no de movimientos.")
+        else:
+            pagina = st.number_input("Página", min_value=1, value=1, key="desglose_pagina")
+            with metricas.etapa('desglose') as etapa:
+                desglose = resultado.desglose.pagina(empresa, banco, columna, pagina - 1)
+                etapa.filas = len(desglose.movimientos)
+            resumen_celda = f"{desglose.total_movimientos} movimientos en {nombre_columna} de {banco} ({empresa}) por ${desglose.importe:,.2f}."
+            if columna in COLUMNAS_A_CUBRIR:
+                resumen_celda += f" La celda es Saldo Banco menos esos movimientos: ${desglose.valor:,.2f}."
+            st.caption(f"{resumen_celda} Página {desglose.pagina + 1} de {desglose.paginas}.")
+            st.dataframe(desglose.movimientos, hide_index=True)
+
+    archivos_stats, descargas_stats = parse_cache.stats(), export_cache.stats()
+    st.caption(
+        f"Caché compartida: archivos {archivos_stats['hit_rate']:.0%} de aciertos "
+        f"({archivos_stats['bytes'] / 2**20:.0f}/{archivos_stats['max_bytes'] / 2**20:.0f} MB), "
+        f"descargas {descargas_stats['hit_rate']:.0%} de aciertos "
+        f"({descargas_stats['bytes'] / 2**20:.0f}/{descargas_stats['max_bytes'] / 2**20:.0f} MB)"
+    )
+
+    st.subheader("Detalle de Saldos de Cajas")
+    # Only display the 'CAJA' and 'Importe' columns from df_cajas as requested for Streamlit UI
+    st.dataframe(df_cajas[['CAJA', 'Importe', 'Detalle']]) # Display only relevant columns
+
+    st.subheader("Proyección de Saldos")
+    col_horizonte, col_diarios, col_semanas = st.columns(3)
+    horizonte = Horizonte(
+        dias=col_horizonte.number_input("Horizonte (días)", min_value=1, max_value=365, value=90, key="horizonte_dias"),
+        dias_diarios=col_diarios.number_input("Días con detalle diario", min_value=0, max_value=365, value=14, key="horizonte_diarios"),
+        semanas=col_semanas.number_input("Semanas, luego meses", min_value=0, max_value=52, value=4, key="horizonte_semanas"),
+    )
+    with metricas.etapa('proyeccion') as etapa:
+        proyeccion = proyectar(resultado.df_total, resultado.df_saldos_clean, resultado.fecha_hoy, horizonte)
+        etapa.filas = len(proyeccion.saldos)
+
+    cuentas_negativas = proyeccion.primer_negativo.notna().sum()
+    st.caption(f"{cuentas_negativas} de {len(proyeccion.primer_negativo)} cuentas quedan en negativo dentro del horizonte.")
+    st.dataframe(proyeccion.resumen())
+    st.line_chart(proyeccion.saldos_diarios.groupby(level=0).sum().T)
+
+    with st.expander("Backtesting: el reporte en varias fechas de corte"):
+        rango_corte = st.date_input(
+            "Fechas de corte",
+            value=((fecha_hoy - pd.Timedelta(days=30)).date(), fecha_hoy.date()),
+            key="backtest_rango"
         )
-
-        df_semana_pivot = df_semana_pivot.reindex(columns=expected_day_columns, fill_value=0)
-
-        df_semana_pivot['Total Semana'] = df_semana_pivot.sum(axis=1)
-
-        # 3. Emitidos (Futuro solo cheques)
-        filtro_emitidos = (df_total['Fecha'] > fecha_limite_semana) & (df_total['Origen'] == 'Cheques')
-        df_emitidos = df_total[filtro_emitidos].groupby(['Empresa', 'Banco_Limpio'])[['Importe']].sum()
-        df_emitidos.columns = ['Emitidos']
-
-        # Unir todo usando left merges, con df_saldos_clean como base
-        reporte_final = df_saldos_clean.copy() # Start with all banks from Saldos.xlsx
-
-        reporte_final = pd.merge(
-            reporte_final,
-            df_vencido, # Merge Vencido
-            left_index=True,
-            right_index=True,
-            how='left'
+        if len(rango_corte) == 2:
+            with metricas.etapa('backtest') as etapa:
+                tabla_backtest = backtest(resultado.df_total, resultado.df_saldos_clean, pd.date_range(*rango_corte))
+                etapa.filas = len(tabla_backtest)
+            st.caption("Saldo Banco es el de Saldos.xlsx para todas las fechas; el resto se calcula con los movimientos cargados.")
+            st.line_chart(totales_por_fecha(tabla_backtest))
+            st.dataframe(tabla_backtest, hide_index=True)
+
+    with st.expander("Simulación de demoras (Monte Carlo)"):
+        st.caption("Cheques que se debitan tarde y pagos que se corren: bandas del saldo diario de la semana y probabilidad de quedar en negativo.")
+        col_escenarios, col_semilla = st.columns(2)
+        escenarios = col_escenarios.number_input("Escenarios", min_value=100, max_value=50000, value=10000, step=1000, key="mc_escenarios")
+        semilla = col_semilla.number_input("Semilla", min_value=0, value=0, key="mc_semilla")
+        if st.toggle("Simular", key="mc_simular"):
+            with metricas.etapa('simulacion') as etapa:
+                simulacion = simular(resultado.df_total, resultado.df_saldos_clean, resultado.fecha_hoy, escenarios=escenarios, semilla=semilla)
+                etapa.filas = escenarios
+            st.dataframe(
+                pd.concat([simulacion.prob_negativo, simulacion.saldo_inicial.rename('Saldo Inicial')], axis=1)
+                .sort_values('Prob. Negativo', ascending=False),
+                column_config={'Prob. Negativo': st.column_config.ProgressColumn(min_value=0, max_value=1, format='percent')}
+            )
+            cuenta_simulada = st.selectbox(
+                "Banco", simulacion.prob_negativo.index.tolist(), format_func=lambda cuenta: f"{cuenta[0]} - {cuenta[1]}", key="mc_cuenta"
+            )
+            if cuenta_simulada is not None:
+                st.line_chart(simulacion.banda(cuenta_simulada))
+
+    with st.expander("Conciliación de Cheques contra Proyección de Pagos"):
+        with metricas.etapa('conciliacion') as etapa:
+            conciliacion = conciliar(resultado.frames['Proyeccion'], resultado.frames['Cheques'])
+            etapa.filas = len(conciliacion.coincidencias) + len(conciliacion.sospechosos)
+        st.caption(
+            f"{len(conciliacion.coincidencias)} cheques figuran también en la proyección de pagos "
+            f"(${conciliacion.importe_duplicado:,.2f} contados dos veces en el reporte); "
+            f"{len(conciliacion.sospechosos)} pares sospechosos para revisar."
         )
-
-        reporte_final = pd.merge(
-            reporte_final,
-            df_semana_pivot, # Merge Semana
-            left_index=True,
-            right_index=True,
-            how='left'
+        st.write("Coincidencias")
+        st.dataframe(conciliacion.coincidencias, hide_index=True)
+        st.write("Sospechosos")
+        st.dataframe(conciliacion.sospechosos, hide_index=True)
+        col_cheques, col_proyeccion = st.columns(2)
+        col_cheques.metric("Cheques sin par", len(conciliacion.cheques_sin_par))
+        col_proyeccion.metric("Pagos proyectados sin par", len(conciliacion.proyeccion_sin_par))
+
+    with st.expander("Historial: tendencia y cambios desde la fecha anterior"):
+        fechas_historial = fechas_guardadas()
+        anteriores = [fecha for fecha in fechas_historial if fecha < resultado.fecha_hoy]
+        if not anteriores:
+            st.caption("Todavía no hay fechas anteriores guardadas en el historial.")
+        else:
+            rango_historial = st.date_input(
+                "Período",
+                value=(max(fechas_historial[0], resultado.fecha_hoy - pd.DateOffset(months=12)).date(), resultado.fecha_hoy.date()),
+                key="historial_rango"
+            )
+            if len(rango_historial) == 2:
+                with metricas.etapa('tendencia') as etapa:
+                    tabla_tendencia = tendencia(*rango_historial)
+                    etapa.filas = len(tabla_tendencia)
+                st.line_chart(tabla_tendencia.groupby(level='Fecha_Corte').sum())
+
+            fecha_anterior = st.selectbox(
+                "Comparar con", anteriores[::-1], format_func=lambda fecha: fecha.strftime('%d/%m/%Y'), key="historial_anterior"
+            )
+            with metricas.etapa('cambios') as etapa:
+                tabla_cambios = cambios(fecha_anterior, resultado.fecha_hoy)
+                etapa.filas = len(tabla_cambios)
+            nuevos = tabla_cambios['Cambio'] == 'Nuevo'
+            st.caption(
+                f"{tabla_cambios.loc[nuevos, 'Cantidad'].sum()} movimientos nuevos y "
+                f"{tabla_cambios.loc[~nuevos, 'Cantidad'].sum()} que ya no están desde el {fecha_anterior.strftime('%d/%m/%Y')}."
+            )
+            st.dataframe(tabla_cambios, hide_index=True)
+
+    with st.expander("Consultas sobre el historial"):
+        st.caption("Cada movimiento se cuenta una vez, como figuraba en la primera corrida guardada desde su fecha.")
+        nombre_consulta = st.selectbox(
+            "Consulta", list(CONSULTAS), format_func=lambda nombre: CONSULTAS[nombre].titulo, key="consulta_nombre"
         )
-
-        reporte_final = pd.merge(
-            reporte_final,
-            df_emitidos, # Merge Emitidos
-            left_index=True,
-            right_index=True,
-            how='left'
+        col_rango, col_empresas = st.columns(2)
+        rango_consulta = col_rango.date_input(
+            "Fechas de los movimientos",
+            value=((fecha_hoy - pd.DateOffset(months=3)).date(), fecha_hoy.date()),
+            key="consulta_rango"
         )
-
-        # After all merges, fill NaN values with 0
-        reporte_final = reporte_final.fillna(0)
-
-        # Calcular 'A Cubrir Vencido' como (Saldo Banco - Vencido)
-        reporte_final['A Cubrir Vencido'] = reporte_final['Saldo Banco'] - reporte_final['Vencido']
-
-        # Calculate 'A Cubrir Semana' (formerly 'Disponible Futuro')
-        reporte_final['A Cubrir Semana'] = reporte_final['Saldo Banco'] - reporte_final['Vencido'] - reporte_final['Total Semana']
-
-        # Reordenar columnas para colocar 'Saldo Banco' y 'Saldo FCI' antes de 'Vencido'
-        # y luego 'A Cubrir Vencido' e 'A Cubrir Semana' al final.
-        cols = reporte_final.columns.tolist()
-
-        # Define lists for new column order
-        new_order_cols = []
-
-        # 1. Add static leading columns
-        if 'Saldo Banco' in cols: new_order_cols.append('Saldo Banco')
-        if 'Saldo FCI' in cols: new_order_cols.append('Saldo FCI')
-        if 'Vencido' in cols: new_order_cols.append('Vencido')
-
-        # 2. Add daily columns in their specific order
-        for col in expected_day_columns:
-            if col in cols:
-                new_order_cols.append(col)
-
-        # 3. Add 'Total Semana' and 'Emitidos'
-        if 'Total Semana' in cols: new_order_cols.append('Total Semana')
-        if 'Emitidos' in cols: new_order_cols.append('Emitidos')
-
-        # 4. Collect other existing columns that are not 'A Cubrir Vencido' or 'A Cubrir Semana'
-        #    and have not been added yet. This handles any unforeseen columns and ensures
-        #    ACV and ACS are indeed last.
-        for col in cols:
-            if col not in new_order_cols and col != 'A Cubrir Vencido' and col != 'A Cubrir Semana':
-                new_order_cols.append(col)
-
-        # 5. Append 'A Cubrir Vencido' and 'A Cubrir Semana' at the very end in the specified order
-        if 'A Cubrir Vencido' in cols:
-            new_order_cols.append('A Cubrir Vencido')
-        if 'A Cubrir Semana' in cols:
-            new_order_cols.append('A Cubrir Semana')
-
-        reporte_final = reporte_final[new_order_cols]
-
-        # ========================================== Streamlit Output ==========================================
-        st.subheader("Reporte de Cashflow Generado")
-        st.dataframe(reporte_final)
-
-        st.subheader("Detalle de Saldos de Cajas")
-        # Only display the 'CAJA' and 'Importe' columns from df_cajas as requested for Streamlit UI
-        st.dataframe(df_cajas[['CAJA', 'Importe', 'Detalle']]) # Display only relevant columns
-
-        # Para la descarga del Excel
-        output_excel_data = io.BytesIO()
-        writer = pd.ExcelWriter(output_excel_data, engine='xlsxwriter')
-        workbook = writer.book
-
-        # Add 'Resumen' worksheet
-        worksheet = workbook.add_worksheet('Resumen')
-
-        # --- DEFINICIÓN DE FORMATOS ---
-        # Define default font for all formats
-        default_font_properties = {'font_name': 'Bahnshift SemiLight'}
-
-        fmt_header = workbook.add_format({
-            **default_font_properties,
-            'bold': True, 'font_color': 'white', 'bg_color': '#ED7D31',
-            'border': 1, 'align': 'center', 'valign': 'vcenter',
-            'text_wrap': True
-        })
-        # Subtotal LABEL format (e.g., "Total BYC")
-        fmt_subtotal_label = workbook.add_format({
-            **default_font_properties,
-            'bold': True, 'bg_color': '#FCE4D6',
-            'border': 1, 'align': 'left', 'valign': 'vcenter'
-        })
-        # Subtotal VALUE format
-        fmt_subtotal_value = workbook.add_format({
-            **default_font_properties,
-            'bold': True, 'bg_color': '#FCE4D6', 'num_format': '$ #,##0',
-            'border': 1, 'align': 'right', 'valign': 'vcenter'
-        })
-        fmt_currency = workbook.add_format({
-            **default_font_properties,
-            'num_format': '$ #,##0', 'border': 1, 'align': 'right'
-        })
-        fmt_text = workbook.add_format({
-            **default_font_properties,
-            'border': 1
-        })
-        # New format for dates
-        fmt_date = workbook.add_format({
-            **default_font_properties,
-            'num_format': 'dd/mm/yyyy', 'border': 1
-        })
-
-        # New formats for conditional formatting on 'A Cubrir Vencido' and 'A Cubrir Semana'
-        fmt_positive_acv = workbook.add_format({
-            **default_font_properties,
-            'bold': True, 'bg_color': '#C6EFCE', 'font_color': '#006100', 'num_format': '$ #,##0', 'border': 1, 'align': 'right'
-        })
-        fmt_negative_acv = workbook.add_format({
-            **default_font_properties,
-            'bold': True, 'bg_color': '#FFC7CE', 'font_color': '#9C0006', 'num_format': '$ #,##0', 'border': 1, 'align': 'right'
-        })
-
-        # New format for the grand total row *label* "TOTAL BANCOS"
-        fmt_grand_total_label = workbook.add_format({
-            **default_font_properties,
-            'bold': True, 'bg_color': '#BFBFBF',
-            'border': 1, 'align': 'left', 'valign': 'vcenter'
-        })
-
-        # New format for the grand total row *values*
-        fmt_grand_total_value = workbook.add_format({
-            **default_font_properties,
-            'bold': True, 'bg_color': '#BFBFBF', 'num_format': '$ #,##0',
-            'border': 1, 'align': 'right', 'valign': 'vcenter'
-        })
-
-        # --- ESCRIBIR ENCABEZADOS ---
-        worksheet.write('A1', 'Resumen Cashflow', workbook.add_format({**default_font_properties, 'bold': True, 'font_size': 14}))
-        worksheet.write('A2', f"Fecha Actual: {fecha_hoy.strftime('%d/%m/%Y')}")
-
-        fila_actual = 3
-        col_bancos = 0
-        worksheet.write(fila_actual, col_bancos, "Etiquetas de fila", fmt_header)
-
-        columnas_datos = reporte_final.columns.tolist()
-
-        # Find the index of 'A Cubrir Vencido' for conditional formatting
-        acv_col_idx = -1
-        if 'A Cubrir Vencido' in columnas_datos:
-            acv_col_idx = columnas_datos.index('A Cubrir Vencido') + 1 # +1 because of the bank column at index 0
-
-        # Find the index of 'A Cubrir Semana' for conditional formatting
-        acs_col_idx = -1
-        if 'A Cubrir Semana' in columnas_datos:
-            acs_col_idx = columnas_datos.index('A Cubrir Semana') + 1 # +1 because of the bank column at index 0
-
-        for i, col_name in enumerate(columnas_datos):
-            worksheet.write(fila_actual, i + 1, col_name, fmt_header)
-
-        fila_actual += 1
-
-        # --- ESCRIBIR DATOS POR GRUPO (EMPRESA) ---
-        empresas_unicas = reporte_final.index.get_level_values(0).unique()
-
-        for empresa in empresas_unicas:
-            datos_empresa = reporte_final.loc[empresa]
-
-            if isinstance(datos_empresa, pd.Series):
-                banco_limpio_idx = datos_empresa.name[1]
-                datos_empresa = pd.DataFrame(datos_empresa).T
-                datos_empresa.index = [banco_limpio_idx]
-                datos_empresa.index.name = 'Banco_Limpio'
-
-            for banco, row in datos_empresa.iterrows():
-                worksheet.write(fila_actual, 0, banco, fmt_text)
-
-                for i, val in enumerate(row):
-                    current_col_excel_idx = i + 1
-                    if current_col_excel_idx == acv_col_idx or current_col_excel_idx == acs_col_idx:
-                        if val > 0:
-                            worksheet.write(fila_actual, current_col_excel_idx, val, fmt_positive_acv)
-                        elif val < 0:
-                            worksheet.write(fila_actual, current_col_excel_idx, val, fmt_negative_acv)
-                        else:
-                            worksheet.write(fila_actual, current_col_excel_idx, val, fmt_currency) # Default for 0
-                    else:
-                        worksheet.write(fila_actual, current_col_excel_idx, val, fmt_currency)
-
-                fila_actual += 1
-
-            # --- CREAR FILA DE SUBTOTAL ---
-            worksheet.write(fila_actual, 0, f"Total {empresa}", fmt_subtotal_label) # Apply specific label format
-
-            sumas = datos_empresa.sum()
-            for i, val in enumerate(sumas): # Loop through subtotal values
-                current_col_excel_idx = i + 1
-                # Apply conditional formatting to subtotal rows as well
-                if current_col_excel_idx == acv_col_idx or current_col_excel_idx == acs_col_idx:
-                    if val > 0:
-                            worksheet.write(fila_actual, current_col_excel_idx, val, fmt_positive_acv) # Already bold and right-aligned
-                    elif val < 0:
-                        worksheet.write(fila_actual, current_col_excel_idx, val, fmt_negative_acv) # Already bold and right-aligned
-                    else:
-                        worksheet.write(fila_actual, current_col_excel_idx, val, fmt_subtotal_value) # Default for 0, now bold and right-aligned
-                else:
-                    worksheet.write(fila_actual, i + 1, val, fmt_subtotal_value) # Use subtotal value format
-
-            fila_actual += 1
-
-        # --- CREAR FILA DE TOTAL BANCOS ---
-        # Sum all numeric columns for the grand total row
-        grand_totals_series = reporte_final.select_dtypes(include=['number']).sum()
-
-        worksheet.write(fila_actual, 0, "TOTAL BANCOS", fmt_grand_total_label) # Use specific label format
-
-        for i, col_name in enumerate(columnas_datos):
-            val = grand_totals_series.get(col_name, "") # Get calculated total or empty string
-            current_col_excel_idx = i + 1
-            # Apply conditional formatting to grand total row as well
-            if current_col_excel_idx == acv_col_idx or current_col_excel_idx == acs_col_idx:
-                if isinstance(val, (int, float)):
-                    if val > 0:
-                        worksheet.write(fila_actual, current_col_excel_idx, val, fmt_positive_acv) # Already bold and right-aligned
-                    elif val < 0:
-                        worksheet.write(fila_actual, current_col_excel_idx, val, fmt_negative_acv) # Already bold and right-aligned
-                    else:
-                        worksheet.write(fila_actual, current_col_excel_idx, val, fmt_grand_total_value) # Default for 0
-                else:
-                     worksheet.write(fila_actual, current_col_excel_idx, val, fmt_grand_total_value) # For non-numeric or empty string
-            else:
-                worksheet.write(fila_actual, i + 1, val, fmt_grand_total_value) # Use grand total value format
-
-        fila_actual += 1
-
-        # Ajustar ancho de columnas (main report area)
-        worksheet.set_column(0, 0, 25) # Column A (Etiquetas de fila)
-        worksheet.set_column(1, len(columnas_datos), 15) # All data columns (B onwards) to a more generous 15 width
-
-        # Add 'Base' worksheet and write df_pivot_base
-        worksheet_base = workbook.add_worksheet('Base')
-        # Write headers
-        for col_num, value in enumerate(df_pivot_base.columns.values):
-            worksheet_base.write(0, col_num, value, fmt_header)
-        # Write data
-        for r_idx, row_data in enumerate(df_pivot_base.values):
-            for c_idx, cell_data in enumerate(row_data):
-                # Apply currency format only to 'Importe' column
-                if df_pivot_base.columns[c_idx] == 'Importe':
-                    worksheet_base.write(r_idx + 1, c_idx, cell_data, fmt_currency)
-                elif df_pivot_base.columns[c_idx] == 'Fecha':
-                    worksheet_base.write(r_idx + 1, c_idx, cell_data, fmt_date)
-                else:
-                    worksheet_base.write(r_idx + 1, c_idx, cell_data, fmt_text)
-
-        # Adjust column widths for 'Base' sheet
-        for i, col in enumerate(df_pivot_base.columns):
-            max_len = max(df_pivot_base[col].astype(str).map(len).max(), len(col))
-            worksheet_base.set_column(i, i, max_len + 2)
-
-        # Add 'Tabla Dinamica' worksheet
-        # Note: The original request to remove this worksheet implies we should not be creating it.
-        # If the user wishes to add it back, this section would be uncommented/re-added.
-
-        # Add 'Saldos Cajas' worksheet and write df_cajas
-        worksheet_cajas = workbook.add_worksheet('Saldos Cajas')
-        # Write headers for the selected columns (CAJA, Importe, Detalle)
-        cajas_display_columns = ['CAJA', 'Importe', 'Detalle']
-        for col_num, value in enumerate(cajas_display_columns):
-            worksheet_cajas.write(0, col_num, value, fmt_header)
-        # Write data for the selected columns
-        for r_idx, row_data in enumerate(df_cajas[cajas_display_columns].values):
-            for c_idx, cell_data in enumerate(row_data):
-                # Apply currency format only to 'Importe' column
-                if cajas_display_columns[c_idx] == 'Importe':
-                    worksheet_cajas.write(r_idx + 1, c_idx, cell_data, fmt_currency)
-                else:
-                    worksheet_cajas.write(r_idx + 1, c_idx, cell_data, fmt_text)
-
-        # Adjust column widths for 'Saldos Cajas' sheet
-        for i, col in enumerate(cajas_display_columns):
-            max_len = max(df_cajas[col].astype(str).map(len).max(), len(col))
-            worksheet_cajas.set_column(i, i, max_len + 2)
-
-        writer.close()
-        output_excel_data.seek(0)
-
-        st.download_button(
-            label="Descargar Reporte de Cashflow Formateado",
-            data=output_excel_data,
-            file_name="Resumen_Cashflow_Formateado.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        empresas_consulta = col_empresas.multiselect(
+            "Empresas (todas si no se elige ninguna)", sorted(resultado.df_total['Empresa'].astype(str).unique()), key="consulta_empresas"
         )
-
-        # Para la descarga del PDF
-        output_pdf_data = io.BytesIO()
-
-        class PDF(FPDF):
-            def header(self):
-                self.set_font('Arial', 'B', 12)
-                self.cell(0, 10, 'Resumen Cashflow', 0, 1, 'C')
-                self.set_font('Arial', '', 10)
-                self.cell(0, 10, f"Fecha Actual: {fecha_hoy.strftime('%d/%m/%Y')}", 0, 1, 'L')
-                self.ln(5)
-
-            def footer(self):
-                self.set_y(-15)
-                self.set_font('Arial', 'I', 8)
-                self.cell(0, 10, 'Page %s' % self.page_no(), 0, 0, 'C')
-
-        pdf = PDF(orientation='L') # Landscape orientation
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font('Arial', '', 8)
-
-        # Prepare data for PDF table
-        reporte_final_for_pdf = reporte_final.reset_index()
-        reporte_final_for_pdf['Banco'] = reporte_final_for_pdf['Empresa'] + ' - ' + reporte_final_for_pdf['Banco_Limpio']
-        reporte_final_for_pdf = reporte_final_for_pdf.drop(columns=['Empresa', 'Banco_Limpio'])
-
-        # Reorder columns for PDF display (Banco first, then original order from reporte_final)
-        col_names_pdf_ordered = ['Banco'] + reporte_final.columns.tolist()
-        reporte_final_for_pdf = reporte_final_for_pdf[col_names_pdf_ordered]
-
-        # Column headers for PDF (keep \n characters for multi_cell)
-        processed_col_names = col_names_pdf_ordered # Use original names including \n
-
-        # Determine max height for the header row
-        max_header_height = 0
-        line_height_base = 5 # Use the same height as in the multi_cell call for consistency
-
-        # Allocate fixed width for 'Banco' column and distribute remaining width for others
-        page_width = pdf.w - 2 * pdf.l_margin
-        fixed_banco_width = 45
-        num_data_cols = len(processed_col_names) - 1
-        col_widths = [fixed_banco_width] + [(page_width - fixed_banco_width) / num_data_cols] * num_data_cols
-
-        # Capture initial X and Y for height calculation loop
-        initial_x_calc = pdf.get_x()
-        initial_y_calc = pdf.get_y()
-
-        current_x_pos_calc = initial_x_calc
-
-        for i, header_text in enumerate(processed_col_names):
-            # Temporarily set position for dry_run
-            pdf.set_xy(current_x_pos_calc, initial_y_calc)
-            # Use dry_run to get the actual number of lines multi_cell will generate
-            # Setting a generous height to ensure it calculates lines correctly even if text wraps a lot
-            lines_count = pdf.multi_cell(col_widths[i], line_height_base, header_text, 0, 'C', 0, 1, dry_run=True, output='S') # output='S' to return string
-            # Calculate the height needed for this specific cell
-            height_for_this_cell = lines_count.count('\n') + 1 * line_height_base if lines_count else line_height_base # Count newlines for height
-            max_header_height = max(max_header_height, height_for_this_cell)
-            current_x_pos_calc += col_widths[i] # Advance X for next header calculation
-
-        # Ensure a minimum height if no text causes wrapping (e.g., all single line)
-        if max_header_height == 0:
-            max_header_height = line_height_base # Default to single line height
-
-        # Restore original Y position and X position after height calculation
-        pdf.set_xy(initial_x_calc, initial_y_calc)
-
-        # Write header row
-        pdf.set_fill_color(237, 125, 49) # Orange header color
-        pdf.set_text_color(255, 255, 255) # White text
-        pdf.set_font('Arial', 'B', 8)
-
-        # Store starting X and Y for the actual header drawing
-        current_x_draw = pdf.get_x()
-        current_y_draw = pdf.get_y()
-
-        for i, header in enumerate(processed_col_names):
-            # Set position explicitly for each cell to ensure alignment
-            pdf.set_xy(current_x_draw, current_y_draw)
-            pdf.multi_cell(col_widths[i], max_header_height / (lines_count.count('\n') + 1), header, 1, 'C', 1, 0) # Adjusted height per line for multi_cell
-            current_x_draw += col_widths[i] # Advance X for the next cell in the row
-
-        pdf.ln(max_header_height) # Move to the next line after the entire header row
-
-        # Write data rows and subtotals
-        pdf.set_font('Arial', '', 8)
-
-        # Get indices for conditional formatting columns in the `reporte_final` (original) DataFrame
-        acv_col_idx = -1
-        if 'A Cubrir Vencido' in reporte_final.columns:
-            acv_col_idx = reporte_final.columns.get_loc('A Cubrir Vencido')
-
-        acs_col_idx = -1
-        if 'A Cubrir Semana' in reporte_final.columns:
-            acs_col_idx = reporte_final.columns.get_loc('A Cubrir Semana')
-
-        empresas_unicas = reporte_final.index.get_level_values(0).unique()
-
-        for empresa in empresas_unicas:
-            datos_empresa = reporte_final.loc[empresa]
-
-            if isinstance(datos_empresa, pd.Series):
-                banco_limpio_idx = datos_empresa.name[1]
-                datos_empresa = pd.DataFrame(datos_empresa).T
-                datos_empresa.index = [banco_limpio_idx]
-
-            for banco, row in datos_empresa.iterrows():
-                # Write bank name (first column in PDF)
-                pdf.set_font('Arial', '', 8) # Regular font for data
-                pdf.cell(col_widths[0], 6, str(banco), 1, 0, 'L')
-
-                # Write numeric data
-                for i, col_name_orig in enumerate(reporte_final.columns):
-                    val = row[col_name_orig]
-
-                    # Determine text to display: blank if 0, otherwise formatted value
-                    display_text = '' if val == 0 else f"${val:,.0f}"
-
-                    fill_cell = 0 # No fill by default
-                    text_color = (0,0,0) # Black by default
-                    fill_color = (255,255,255) # White by default
-
-                    if col_name_orig == 'A Cubrir Vencido' or col_name_orig == 'A Cubrir Semana':
-                        if val > 0:
-                            fill_color = (198, 239, 206) # Light Green
-                            text_color = (0, 97, 0)     # Dark Green
-                            fill_cell = 1
-                        elif val < 0:
-                            fill_color = (255, 199, 206) # Light Red
-                            text_color = (156, 0, 6)    # Dark Red
-                            fill_cell = 1
-
-                    pdf.set_text_color(*text_color)
-                    pdf.set_fill_color(*fill_color)
-                    pdf.cell(col_widths[i+1], 6, display_text, 1, 0, 'R', fill_cell)
-
-                    pdf.set_text_color(0,0,0) # Reset colors for next cell
-                    pdf.set_fill_color(255,255,255)
-                pdf.ln()
-
-            # Subtotal row
-            pdf.set_font('Arial', 'B', 8) # Bold for subtotal
-            pdf.set_fill_color(252, 228, 214) # Light orange background
-            pdf.cell(col_widths[0], 6, f"Total {empresa}", 1, 0, 'L', 1) # Label cell
-
-            sumas = datos_empresa.sum()
-            for i, col_name_orig in enumerate(reporte_final.columns):
-                val = sumas[col_name_orig]
-
-                # Determine text to display: blank if 0, otherwise formatted value
-                display_text = '' if val == 0 else f"${val:,.0f}"
-
-                fill_cell = 1 # Always fill subtotal cells
-                text_color = (0,0,0) # Black by default
-                fill_color = (252, 228, 214) # Light orange by default
-
-                if col_name_orig == 'A Cubrir Vencido' or col_name_orig == 'A Cubrir Semana':
-                    if val > 0:
-                        fill_color = (198, 239, 206) # Light Green
-                        text_color = (0, 97, 0)     # Dark Green
-                    elif val < 0:
-                        fill_color = (255, 199, 206) # Light Red
-                        text_color = (156, 0, 6)    # Dark Red
-
-                pdf.set_text_color(*text_color)
-                pdf.set_fill_color(*fill_color)
-                pdf.cell(col_widths[i+1], 6, display_text, 1, 0, 'R', fill_cell)
-
-                pdf.set_text_color(0,0,0) # Reset colors
-                pdf.set_fill_color(252, 228, 214)
-            pdf.ln()
-            pdf.ln(2) # Small break between companies
-
-        # Grand Total row
-        pdf.set_font('Arial', 'B', 8) # Bold for grand total
-        pdf.set_fill_color(191, 191, 191) # Grey background
-        pdf.cell(col_widths[0], 6, "TOTAL BANCOS", 1, 0, 'L', 1) # Label cell
-
-        # Sum all numeric columns for the grand total row
-        grand_totals_series = reporte_final.select_dtypes(include=['number']).sum()
-
-        for i, col_name_orig in enumerate(reporte_final.columns):
-            val = grand_totals_series.get(col_name_orig, "") # Get calculated total or empty string
-
-            # Determine text to display: blank if 0, otherwise formatted value
-            if isinstance(val, (int, float)):
-                display_text = '' if val == 0 else f"${val:,.0f}"
+        if len(rango_consulta) == 2 and st.toggle("Consultar", key="consulta_ejecutar"):
+            try:
+                with metricas.etapa('consulta') as etapa:
+                    tabla_consulta = ejecutar(nombre_consulta, *rango_consulta, empresas=empresas_consulta)
+                    etapa.filas = len(tabla_consulta)
+            except FileNotFoundError:
+                st.caption("Todavía no hay corridas guardadas en el historial.")
             else:
-                display_text = str(val)
-
-            fill_cell = 1 # Always fill grand total cells
-            text_color = (0,0,0) # Black by default
-            fill_color = (191, 191, 191) # Grey by default
-
-            if col_name_orig == 'A Cubrir Vencido' or col_name_orig == 'A Cubrir Semana':
-                if isinstance(val, (int, float)):
-                    if val > 0:
-                        fill_color = (198, 239, 206) # Light Green
-                        text_color = (0, 97, 0)     # Dark Green
-                    elif val < 0:
-                        fill_color = (255, 199, 206) # Light Red
-                        text_color = (156, 0, 6)    # Dark Red
-
-            pdf.set_text_color(*text_color)
-            pdf.set_fill_color(*fill_color)
-
-            if isinstance(val, (int, float)):
-                pdf.cell(col_widths[i+1], 6, display_text, 1, 0, 'R', fill_cell)
-            else:
-                pdf.cell(col_widths[i+1], 6, str(val), 1, 0, 'R', fill_cell)
-
-            pdf.set_text_color(0,0,0) # Reset colors
-            pdf.set_fill_color(191, 191, 191)
-        pdf.ln()
-
-        # Add a new table for 'Saldos de Cajas' data
-        pdf.ln(10) # Add some vertical space
-        pdf.set_font('Arial', 'B', 10)
-        pdf.cell(0, 10, 'Saldos de Cajas', 0, 1, 'L')
-        pdf.ln(2)
-
-        # Prepare df_cajas for PDF output
-        # Select only the columns that are relevant for the PDF output (CAJA, Importe, Detalle)
-        df_cajas_for_pdf = df_cajas[['CAJA', 'Importe', 'Detalle']].copy()
-
-        # Define headers and column widths for 'Saldos de Cajas' table
-        cajas_headers = ['CAJA', 'Importe', 'Detalle']
-        # Adjust widths for landscape A4 (297mm width, ~277mm usable width with 10mm margins)
-        # Proportional widths: CAJA (70mm), Importe (40mm), Detalle (167mm)
-        cajas_col_widths = [70, 40, 167] # Adjust as necessary to fit page
-
-        # Write headers for 'Saldos de Cajas'
-        pdf.set_fill_color(237, 125, 49) # Orange header color
-        pdf.set_text_color(255, 255, 255) # White text
-        pdf.set_font('Arial', 'B', 8)
-        for i, header in enumerate(cajas_headers):
-            pdf.cell(cajas_col_widths[i], 7, header, 1, 0, 'C', 1)
-        pdf.ln()
-
-        # Write data rows for 'Saldos de Cajas'
-        pdf.set_fill_color(255, 255, 255) # Reset fill color for data rows
-        pdf.set_text_color(0, 0, 0) # Reset text color
-        pdf.set_font('Arial', '', 8)
-        for index, row in df_cajas_for_pdf.iterrows():
-            pdf.cell(cajas_col_widths[0], 6, str(row['CAJA']), 1, 0, 'L')
-            pdf.cell(cajas_col_widths[1], 6, f"${row['Importe']:,.0f}", 1, 0, 'R')
-            pdf.cell(cajas_col_widths[2], 6, str(row['Detalle']), 1, 0, 'L')
-            pdf.ln()
-
-        pdf.output(output_pdf_data)
-        output_pdf_data.seek(0)
-
-        st.download_button(
-            label="Descargar Reporte de Cashflow Formateado (PDF)",
-            data=output_pdf_data,
-            file_name="Resumen_Cashflow_Formateado.pdf",
-            mime="application/pdf"
-        )
-        st.success("¡Listo! Archivo generado y disponible para descarga.")
+                st.dataframe(tabla_consulta, hide_index=True)
+
+    # Each file is rendered on its first click and then served from export_cache (to every
+    # session); those stages are kept per session and shown from the next rerun on
+    huella_reporte = resultado.huella
+
+    if 'metricas_exportacion' not in st.session_state:
+        st.session_state['metricas_exportacion'] = Instrumentacion()
+    # Shared with the threads rendering downloads, so the memory setting goes with each call
+    metricas_exportacion = st.session_state['metricas_exportacion']
+
+    st.download_button(
+        label="Descargar Reporte de Cashflow Formateado",
+        data=lambda: export_cache.get_or_build(
+            (huella_reporte, 'xlsx'), lambda: exportar_excel(resultado, metricas_exportacion, medir_memoria)
+        ),
+        file_name=NOMBRE_XLSX,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+    st.download_button(
+        label="Descargar Reporte de Cashflow Formateado (PDF)",
+        data=lambda: export_cache.get_or_build(
+            (huella_reporte, 'pdf'), lambda: exportar_pdf(resultado, metricas_exportacion, medir_memoria)
+        ),
+        file_name=NOMBRE_PDF,
+        mime="application/pdf"
+    )
+    st.success("¡Listo! Reporte generado y disponible para descarga.")
+
+    if mostrar_metricas:
+        with st.sidebar.expander("Tiempos por etapa", expanded=True):
+            st.caption(f"Ejecución {resultado.instrumentacion.corrida}")
+            st.dataframe(pd.concat([resultado.instrumentacion.tabla(), metricas.tabla()], ignore_index=True), hide_index=True)
+            if metricas_exportacion.etapas:
+                st.caption("Últimas descargas")
+                st.dataframe(metricas_exportacion.tabla().tail(10), hide_index=True)
+            st.caption("Cachés compartidas")
+            st.dataframe(pd.DataFrame([archivos_stats, descargas_stats], index=['Archivos', 'Descargas']))
+
+    perfil = resultado.instrumentacion
+    if perfil.perfilando:
+        with st.sidebar.expander("Perfil (cProfile)"):
+            st.code(perfil.resumen_perfil())
+            with tempfile.NamedTemporaryFile(suffix='.prof') as archivo_perfil:
+                perfil.guardar_perfil(archivo_perfil.name)
+                st.download_button("Descargar perfil (.prof)", data=archivo_perfil.read(), file_name=f"cashflow-{perfil.corrida}.prof")
 
 else:
     st.info("Por favor, sube los archivos para generar el reporte de cashflow.")
@@ -0,0 +1,77 @@
+"""The weekly report evaluated at many as-of dates in one pass over the ledger.
+
+For every fecha de corte the figures are the ones construir_reporte gives with that date
+as fecha_hoy (Vencido, the six days, Emitidos and the A Cubrir columns), but instead of one
+aggregation per date the payments go once into a (cuenta x día) grid spanning all the
+dates; Vencido and Emitidos are then read off its cumulative sums and the days are
+slices of it. Saldo Banco is the same snapshot from Saldos.xlsx for every date.
+"""
+
+import numpy as np
+import pandas as pd
+
+from proyeccion_saldos import UN_DIA, cuentas_movimientos, saldos_por_cuenta
+from reporte import DIAS_SEMANA
+
+COLUMNAS_DIAS = [f'Día +{i}' for i in range(DIAS_SEMANA)]
+
+
+def backtest(df_total, df_saldos_clean, fechas_corte):
+    """Return one row per (Fecha Corte, Empresa, Banco_Limpio) with the report figures as of that date."""
+    fechas = pd.DatetimeIndex(fechas_corte).normalize().unique().sort_values()
+    if fechas.empty:
+        raise ValueError("Se necesita al menos una fecha de corte")
+
+    saldo_banco = saldos_por_cuenta(df_saldos_clean)
+    cuentas = saldo_banco.index
+    n_cuentas, n_fechas = len(cuentas), len(fechas)
+
+    cuenta = cuentas_movimientos(df_total, cuentas)
+    en_cuenta = cuenta >= 0
+    cuenta = cuenta[en_cuenta]
+    centavos = df_total['Importe_Centavos'].to_numpy()[en_cuenta]
+    cheques = (df_total['Origen'] == 'Cheques').to_numpy()[en_cuenta]
+
+    # Bin 0 holds everything before the first date, bins 1..n_dias one day each from the first
+    # date to the last one + DIAS_SEMANA - 1, and the last bin everything after
+    inicio = np.datetime64(fechas[0], 'ns')
+    n_dias = (fechas[-1] - fechas[0]).days + DIAS_SEMANA
+    n_bins = n_dias + 2
+    dia = (df_total['Fecha'].to_numpy()[en_cuenta] - inicio) // UN_DIA
+    bins = np.clip(dia, -1, n_dias) + 1
+
+    def grilla(mascara):
+        return np.bincount(cuenta[mascara] * n_bins + bins[mascara], weights=centavos[mascara],
+                           minlength=n_cuentas * n_bins).reshape(n_cuentas, n_bins)
+
+    pagos = grilla(np.ones(len(cuenta), dtype=bool))
+    pagos_cheques = np.cumsum(grilla(cheques), axis=1)
+
+    hoy = np.asarray((fechas - fechas[0]).days, dtype=np.int64) + 1
+    vencido = np.cumsum(pagos, axis=1)[:, hoy - 1]                      # before the date
+    dias = pagos[:, hoy[:, None] + np.arange(DIAS_SEMANA)]              # (cuenta, fecha, día)
+    emitidos = pagos_cheques[:, -1:] - pagos_cheques[:, hoy + DIAS_SEMANA - 1] # cheques after the week
+
+    # Tidy layout: dates outermost, accounts in Saldos.xlsx order within each date
+    def plano(matriz):
+        return np.asarray(matriz).T.reshape(-1) / 100
+
+    tabla = pd.DataFrame({
+        'Fecha Corte': np.repeat(fechas, n_cuentas),
+        'Empresa': np.tile(cuentas.get_level_values(0), n_fechas),
+        'Banco_Limpio': np.tile(cuentas.get_level_values(1), n_fechas),
+        'Saldo Banco': np.tile(saldo_banco.to_numpy(), n_fechas),
+        'Vencido': plano(vencido),
+    })
+    for i, columna in enumerate(COLUMNAS_DIAS):
+        tabla[columna] = plano(dias[:, :, i])
+    tabla['Total Semana'] = tabla[COLUMNAS_DIAS].sum(axis=1)
+    tabla['Emitidos'] = plano(emitidos)
+    tabla['A Cubrir Vencido'] = tabla['Saldo Banco'] - tabla['Vencido']
+    tabla['A Cubrir Semana'] = tabla['Saldo Banco'] - tabla['Vencido'] - tabla['Total Semana']
+    return tabla
+
+
+def totales_por_fecha(tabla, columnas=('Vencido', 'Total Semana', 'A Cubrir Vencido', 'A Cubrir Semana')):
+    # All accounts added up per fecha de corte, for a chart
+    return tabla.groupby('Fecha Corte')[list(columnas)].sum()
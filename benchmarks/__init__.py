@@ -0,0 +1 @@
+"""Benchmarks of the cashflow pipeline on synthetic workbooks (see bench.py)."""
@@ -0,0 +1,178 @@
+"""Time and memory of every pipeline stage on synthetic inputs of growing size.
+
+    python -m benchmarks.bench --tamanos 1000 10000 100000 --salida resultados.json
+    python -m benchmarks.bench --comparar anterior.json
+
+Each stage runs ``--repeticiones`` times for the wall time (the best run is kept) plus
+once more under tracemalloc for the peak of Python allocations, so tracing does not
+skew the timings. Results go to a JSON file, one record per (tamano, etapa); with
+``--comparar`` the run is also printed against a previous results file.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import xlsxwriter
+
+from benchmarks.datos import NOMBRES_ARCHIVO, generar_archivos
+from exportar import CONSTANT_MEMORY_MIN_ROWS, escribir_tabla, generar_excel, generar_pdf
+from ingesta import ARCHIVOS, especificaciones
+from pipeline import combinar_movimientos, leer_archivos
+from procesamiento import bank_mapping_dict, resolve_bank_columns, tabla_cajas
+from reporte import construir_reporte
+
+TAMANOS = (1_000, 10_000, 100_000)
+
+# Workbooks are generated once per size and seed and reused by later runs
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(__file__), '.datos')
+
+
+def medir(etapa, funcion, repeticiones):
+    """Run ``funcion`` and return ``(resultado, registro)`` with its best wall time and peak memory."""
+    if repeticiones < 1:
+        raise ValueError(f"repeticiones debe ser al menos 1 (se pidió {repeticiones})")
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return resultado, {
+        'etapa': etapa,
+        'segundos': min(tiempos),
+        'segundos_media': sum(tiempos) / len(tiempos),
+        'pico_mb': pico / 2**20,
+        'filas': len(resultado) if hasattr(resultado, '__len__') else None,
+    }
+
+
+def _excel_base(df_pivot_base):
+    # 'Base' sheet on its own, in the same mode generar_excel would pick for it
+    salida = io.BytesIO()
+    libro = xlsxwriter.Workbook(salida, {'constant_memory': len(df_pivot_base) >= CONSTANT_MEMORY_MIN_ROWS})
+    formato = libro.add_format()
+    escribir_tabla(libro.add_worksheet('Base'), df_pivot_base, formato, {}, formato)
+    libro.close()
+    return salida.getvalue()
+
+
+def medir_tamano(movimientos, fecha_hoy, repeticiones, semilla=0):
+    directorio = os.path.join(DIRECTORIO_DATOS, f'{movimientos}-{fecha_hoy:%Y%m%d}-{semilla}')
+    if not os.path.isdir(directorio):
+        generar_archivos(directorio, movimientos, fecha_hoy, semilla)
+    contenidos = leer_archivos({archivo: os.path.join(directorio, nombre) for archivo, nombre in NOMBRES_ARCHIVO.items()})
+
+    registros = []
+
+    def etapa(nombre, funcion):
+        resultado, registro = medir(nombre, funcion, repeticiones)
+        registros.append(registro)
+        return resultado
+
+    # Parsing, one stage per file as the ingestion runs it (bytes in memory, no cache)
+    frames = {}
+    for archivo, (parser, args, kwargs) in especificaciones(fecha_hoy).items():
+        data = contenidos[archivo]
+        frames[archivo] = etapa(f'leer_{archivo}', lambda: parser(io.BytesIO(data), *args, **kwargs))
+    frames = {archivo: frames[archivo] for archivo in ARCHIVOS}
+
+    # Bank mapping on as many raw names as movements (it already runs inside leer_*)
+    bancos_raw = pd.Series(list(bank_mapping_dict) + ['Bco Desconocido SA']).sample(movimientos, replace=True, random_state=semilla)
+    etapa('mapeo_bancos', lambda: resolve_bank_columns(bancos_raw)[0])
+
+    df_total, df_pivot_base = etapa('combinar', lambda: combinar_movimientos(frames, fecha_hoy))
+    registros[-1]['filas'] = len(df_total)
+    reporte_final = etapa('reporte', lambda: construir_reporte(df_total, frames['Saldos'], fecha_hoy))
+    df_cajas = tabla_cajas(frames['Cajas'])
+
+    etapa('excel_resumen', lambda: generar_excel(reporte_final, df_pivot_base.iloc[:0], df_cajas, fecha_hoy).getvalue())
+    registros[-1]['filas'] = len(reporte_final)
+    etapa('excel_base', lambda: _excel_base(df_pivot_base))
+    registros[-1]['filas'] = len(df_pivot_base)
+    etapa('excel', lambda: generar_excel(reporte_final, df_pivot_base, df_cajas, fecha_hoy).getvalue())
+    registros[-1]['filas'] = len(df_pivot_base)
+    etapa('pdf', lambda: generar_pdf(reporte_final, df_cajas, fecha_hoy).getvalue())
+    registros[-1]['filas'] = len(reporte_final)
+
+    for registro in registros:
+        registro['movimientos'] = movimientos
+    return registros
+
+
+def _version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, anterior):
+    # Print seconds and peak memory of this run against a previous results file
+    previos = {(r['movimientos'], r['etapa']): r for r in anterior['resultados']}
+    print(f"{'movimientos':>11} {'etapa':<16} {'seg':>9} {'antes':>9} {'x':>6} {'MB':>8} {'antes':>8}")
+    for r in actual['resultados']:
+        p = previos.get((r['movimientos'], r['etapa']))
+        if p is None:
+            continue
+        print(f"{r['movimientos']:>11} {r['etapa']:<16} {r['segundos']:>9.3f} {p['segundos']:>9.3f} "
+              f"{r['segundos'] / p['segundos'] if p['segundos'] else float('nan'):>6.2f} {r['pico_mb']:>8.1f} {p['pico_mb']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide tiempo y memoria de cada etapa del reporte con datos sintéticos.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=list(TAMANOS), help="cantidades de movimientos a medir")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--fecha', default=None, help="fecha del reporte, AAAA-MM-DD (por defecto hoy)")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default='benchmark_resultados.json', help="archivo JSON de resultados")
+    parser.add_argument('--comparar', default=None, help="archivo JSON de una corrida anterior")
+    args = parser.parse_args(argv)
+    if args.repeticiones < 1:
+        parser.error(f"--repeticiones debe ser al menos 1 (se pidió {args.repeticiones})")
+
+    fecha_hoy = pd.Timestamp(args.fecha).normalize() if args.fecha else pd.Timestamp.now().normalize()
+
+    resultados = []
+    for movimientos in args.tamanos:
+        for registro in medir_tamano(movimientos, fecha_hoy, args.repeticiones, args.semilla):
+            resultados.append(registro)
+            print(f"{movimientos:>9} {registro['etapa']:<16} {registro['segundos']:>9.3f} s {registro['pico_mb']:>9.1f} MB", file=sys.stderr)
+
+    salida = {
+        'version': _version(),
+        'fecha_reporte': fecha_hoy.strftime('%Y-%m-%d'),
+        'ejecutado': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeticiones': args.repeticiones,
+        'resultados': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(salida, f, indent=2, ensure_ascii=False)
+    print(args.salida)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(salida, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
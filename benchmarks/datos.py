@@ -0,0 +1,184 @@
+"""Synthetic input workbooks with the layout the parsers in procesamiento.py expect.
+
+    python -m benchmarks.datos DIRECTORIO MOVIMIENTOS [--fecha AAAA-MM-DD] [--semilla N]
+
+``MOVIMIENTOS`` is split between Proyeccion Pagos, Cheques and the Calendario Impositivo.
+Bank and company names come from ``data_nombres``, with a small share of unknown names so
+the 'UNKNOWN' fallbacks are exercised too. Files are written with xlsxwriter in
+constant_memory mode, so a million rows only costs the time to write them.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from procesamiento import data_nombres
+
+# archivo (see ingesta.ARCHIVOS) -> file name of the real upload
+NOMBRES_ARCHIVO = {
+    'Proyeccion': 'Proyeccion Pagos.xlsx',
+    'Cheques': 'Cheques.xlsx',
+    'Impuestos': 'Calendario de Vencimientos Impositivos.xlsx',
+    'Cajas': 'Saldos de Cajas.xlsx',
+    'Saldos': 'Saldos.xlsx',
+}
+
+# Share of the movements that goes to each file; the Calendario Impositivo gets the rest
+PROPORCION_PROYECCION = 0.55
+PROPORCION_CHEQUES = 0.40
+
+# Share of rows with a name that is not in data_nombres
+PROPORCION_DESCONOCIDOS = 0.02
+
+# Dates are spread over this many days before and after the as-of date
+DIAS_ATRAS = 15
+DIAS_ADELANTE = 30
+
+CAJAS = ['TESORERIA', 'SMT - ENCARGADO', 'MPZ ENCARGADO', 'AKN - ENCARGADO', 'RESERVA', 'CAJA CHICA OFICINA']
+
+
+def _libro(ruta):
+    return xlsxwriter.Workbook(ruta, {'constant_memory': True, 'default_date_format': 'dd/mm/yyyy'})
+
+
+def _escribir(ruta, encabezado, columnas, filas_previas=0):
+    # Columns are lists of equal length (None leaves the cell empty); rows are written in order
+    libro = _libro(ruta)
+    hoja = libro.add_worksheet()
+    hoja.write_row(filas_previas, 0, encabezado)
+    for r, fila in enumerate(zip(*columnas), start=filas_previas + 1):
+        hoja.write_row(r, 0, fila)
+    libro.close()
+
+
+def _nombres(rng, conocidos, desconocido, n):
+    nombres = rng.choice(np.array(conocidos, dtype=object), n)
+    nombres[rng.random(n) < PROPORCION_DESCONOCIDOS] = desconocido
+    return nombres.tolist()
+
+
+def _fechas(rng, fecha_hoy, n):
+    dias = rng.integers(-DIAS_ATRAS, DIAS_ADELANTE + 1, n)
+    return (fecha_hoy + pd.to_timedelta(dias, unit='D')).to_pydatetime().tolist()
+
+
+def _importes(rng, n, maximo):
+    return np.round(rng.uniform(100, maximo, n), 2).tolist()
+
+
+def generar_proyeccion(ruta, n, fecha_hoy, rng):
+    # Banco in A, Fecha in C, Detalle in G, paid mark in H (only blank H rows are read), Importe in J
+    pagado = np.where(rng.random(n) < 0.1, 'X', None).tolist()
+    _escribir(ruta, ['Banco', 'Proveedor', 'Fecha', 'Comprobante', 'Moneda', 'Concepto', 'Detalle', 'Pagado', 'Cuenta', 'Importe'], [
+        _nombres(rng, data_nombres['Proyeccion Pagos'], 'Bco Desconocido SA', n),
+        [f'Proveedor {i}' for i in rng.integers(1, 500, n)],
+        _fechas(rng, fecha_hoy, n),
+        [f'FC-A-{i:08d}' for i in range(n)],
+        ['ARS'] * n,
+        rng.choice(['Servicios', 'Insumos', 'Fletes', 'Alquiler', 'Honorarios'], n).tolist(),
+        [f'Pago {i}' for i in range(n)],
+        pagado,
+        rng.integers(1000, 9999, n).tolist(),
+        _importes(rng, n, 2_500_000),
+    ])
+
+
+def generar_cheques(ruta, n, fecha_hoy, rng):
+    # Fecha in B, Numero in C, Banco in D, Detalle in K, Importe in O
+    _escribir(ruta, ['Interno', 'Fecha Pago', 'Numero', 'Banco', 'Cuenta', 'Emision', 'Tipo', 'Estado', 'Moneda', 'CUIT',
+                     'Beneficiario', 'Concepto', 'Sucursal', 'Observaciones', 'Importe'], [
+        list(range(1, n + 1)),
+        _fechas(rng, fecha_hoy, n),
+        rng.integers(10_000_000, 99_999_999, n).tolist(),
+        _nombres(rng, data_nombres['Cheques'], 'BANCO DESCONOCIDO', n),
+        rng.integers(1000, 9999, n).tolist(),
+        _fechas(rng, fecha_hoy - pd.Timedelta(days=DIAS_ATRAS), n),
+        rng.choice(['ECHEQ', 'FISICO'], n).tolist(),
+        ['EMITIDO'] * n,
+        ['ARS'] * n,
+        [f'30-{i:08d}-1' for i in rng.integers(10_000_000, 99_999_999, n)],
+        [f'Proveedor {i}' for i in rng.integers(1, 500, n)],
+        rng.choice(['Servicios', 'Insumos', 'Fletes'], n).tolist(),
+        rng.integers(1, 300, n).tolist(),
+        [None] * n,
+        _importes(rng, n, 5_000_000),
+    ])
+
+
+def generar_impuestos(ruta, n, fecha_hoy, rng):
+    # Detalle in B, Empresa in C, Fecha in F, Importe in G, Estado in L
+    empresas = sorted(set(data_nombres['EMPRESA']))
+    _escribir(ruta, ['Id', 'Impuesto', 'Empresa', 'Jurisdiccion', 'Periodo', 'Vencimiento', 'Importe', 'Formulario',
+                     'Responsable', 'VEP', 'Observaciones', 'Estado'], [
+        list(range(1, n + 1)),
+        rng.choice(['IVA', 'Ganancias', 'IIBB', 'SICOSS', 'Sellos'], n).tolist(),
+        _nombres(rng, empresas, 'ZZZ', n),
+        rng.choice(['Nacional', 'Mendoza', 'Buenos Aires'], n).tolist(),
+        [f'{fecha_hoy.month:02d}/{fecha_hoy.year}'] * n,
+        _fechas(rng, fecha_hoy, n),
+        _importes(rng, n, 8_000_000),
+        rng.integers(100, 999, n).tolist(),
+        ['Administracion'] * n,
+        [None] * n,
+        [None] * n,
+        rng.choice(['VENCIDO', 'A PAGAR', 'PAGADO'], n, p=[0.1, 0.6, 0.3]).tolist(),
+    ])
+
+
+def generar_saldos(ruta, rng):
+    # One balance per bank: Banco in A, Saldo FCI in B, Saldo Banco in C
+    bancos = list(data_nombres['Proyeccion Pagos'])
+    _escribir(ruta, ['Banco', 'FCI', 'Saldo'], [
+        bancos,
+        _importes(rng, len(bancos), 20_000_000),
+        np.round(rng.uniform(-5_000_000, 50_000_000, len(bancos)), 2).tolist(),
+    ])
+
+
+def generar_cajas(ruta, rng):
+    # Header on row 7, Caja in B, Saldo in D
+    _escribir(ruta, ['Numero', 'Caja', 'Responsable', 'Saldo'], [
+        list(range(1, len(CAJAS) + 1)),
+        CAJAS,
+        [None] * len(CAJAS),
+        _importes(rng, len(CAJAS), 3_000_000),
+    ], filas_previas=6)
+
+
+def generar_archivos(directorio, movimientos, fecha_hoy, semilla=0):
+    """Write the five workbooks for ``movimientos`` movements into ``directorio``; returns archivo -> path."""
+    fecha_hoy = pd.Timestamp(fecha_hoy).normalize()
+    rng = np.random.default_rng(semilla)
+    os.makedirs(directorio, exist_ok=True)
+    rutas = {archivo: os.path.join(directorio, nombre) for archivo, nombre in NOMBRES_ARCHIVO.items()}
+
+    n_proyeccion = int(movimientos * PROPORCION_PROYECCION)
+    n_cheques = int(movimientos * PROPORCION_CHEQUES)
+    n_impuestos = max(movimientos - n_proyeccion - n_cheques, 1)
+
+    generar_proyeccion(rutas['Proyeccion'], n_proyeccion, fecha_hoy, rng)
+    generar_cheques(rutas['Cheques'], n_cheques, fecha_hoy, rng)
+    generar_impuestos(rutas['Impuestos'], n_impuestos, fecha_hoy, rng)
+    generar_saldos(rutas['Saldos'], rng)
+    generar_cajas(rutas['Cajas'], rng)
+    return rutas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera archivos de entrada sintéticos para el reporte de cashflow.")
+    parser.add_argument('directorio')
+    parser.add_argument('movimientos', type=int)
+    parser.add_argument('--fecha', default=None, help="fecha de referencia, AAAA-MM-DD (por defecto hoy)")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fecha_hoy = pd.Timestamp(args.fecha) if args.fecha else pd.Timestamp.now().normalize()
+    for ruta in generar_archivos(args.directorio, args.movimientos, fecha_hoy, args.semilla).values():
+        print(ruta)
+
+
+if __name__ == '__main__':
+    main()
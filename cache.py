@@ -0,0 +1,146 @@
+"""Caches for parsed uploads and generated downloads.
+
+Streamlit re-executes app.py on every widget interaction, so anything defined
+there is rebuilt each time. The cache classes live in this module; app.py keeps one
+instance of each for the whole server process, shared by every session, so an analyst
+uploading the same files as a colleague gets the frames and downloads already built.
+Both caches are LRU with a limit on entries and on the bytes they hold.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budgets of the caches shared by every session, in MB; the server's environment may
+# override them
+PRESUPUESTO_ARCHIVOS_MB = int(os.environ.get('CASHFLOW_CACHE_ARCHIVOS_MB', 512))
+PRESUPUESTO_DESCARGAS_MB = int(os.environ.get('CASHFLOW_CACHE_DESCARGAS_MB', 128))
+
+
+def _spec_token(value):
+    # DataFrames (e.g. nombres_df) are keyed by their content, everything else by repr
+    if isinstance(value, pd.DataFrame):
+        h = hashlib.sha256(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        h.update(repr(value.columns.tolist()).encode())
+        return h.hexdigest()
+    return repr(value)
+
+
+def fingerprint(*values):
+    """Content hash of DataFrames and plain values, e.g. to key the exports of a report."""
+    h = hashlib.sha256()
+    for value in values:
+        h.update(b'\x00' + _spec_token(value).encode())
+    return h.hexdigest()
+
+
+def make_key(data, parser, args=(), kwargs=None):
+    """Build the cache key from the file bytes and the column spec passed to ``parser``."""
+    h = hashlib.sha256(data)
+    h.update(parser.__name__.encode())
+    for value in args:
+        h.update(b'\x00' + _spec_token(value).encode())
+    for name, value in sorted((kwargs or {}).items()):
+        h.update(b'\x00' + name.encode() + b'=' + _spec_token(value).encode())
+    return h.hexdigest()
+
+
+def tamano(value):
+    """Bytes held by a cached value: deep memory usage of a frame, length of bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+
+class _LRU:
+    """Thread-safe LRU store evicting past ``max_entries`` entries or ``max_bytes`` bytes (no limit if None)."""
+
+    def __init__(self, max_entries=16, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        # The cached value (counting a hit) or None (counting a miss)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def _put(self, key, value):
+        size = tamano(value)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # Would evict everything else and still not fit
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.bytes -= self._entries.popitem(last=False)[1][1]  # Evict least recently used
+                self.evictions += 1
+
+    def stats(self):
+        consultas = self.hits + self.misses
+        return {
+            'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / consultas if consultas else 0.0,
+            'evictions': self.evictions, 'entries': len(self._entries), 'max_entries': self.max_entries,
+            'bytes': self.bytes, 'max_bytes': self.max_bytes,
+        }
+
+
+class ParseCache(_LRU):
+    """LRU cache of normalized DataFrames keyed by upload content + column spec.
+
+    Thread-safe: reports are generated in background jobs (see trabajos.py), of every session
+    when the cache is shared.
+    """
+
+    def lookup(self, key):
+        """Return a copy of the cached frame for ``key`` (counting a hit), or None (counting a miss)."""
+        df = self._get(key)
+        return None if df is None else df.copy()
+
+    def store(self, key, df):
+        self._put(key, df)
+
+
+class ArtifactCache(_LRU):
+    """Thread-safe LRU of generated files (bytes) keyed by the fingerprint of their inputs.
+
+    Deferred download callables and background jobs run on threads of their own, hence the lock.
+    """
+
+    def __init__(self, max_entries=4, max_bytes=None):
+        super().__init__(max_entries, max_bytes)
+
+    def store(self, key, data):
+        self._put(key, data)
+
+    def get_or_build(self, key, builder):
+        """Return the bytes cached under ``key`` or build them with ``builder()`` (bytes or file-like)."""
+        data = self._get(key)
+        if data is not None:
+            return data
+
+        data = builder()
+        if hasattr(data, 'getvalue'):
+            data = data.getvalue()
+        self._put(key, data)
+        return data
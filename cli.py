@@ -0,0 +1,125 @@
+"""Command-line entry point: builds the cashflow report from five files without Streamlit.
+
+    python cli.py --proyeccion "Proyeccion Pagos.xlsx" --cheques Cheques.xlsx \
+        --saldos Saldos.xlsx --impuestos "Calendario de Vencimientos Impositivos.xlsx" \
+        --cajas "Saldos de Cajas.xlsx" --fecha 2025-12-02 --salida reportes/
+"""
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from backtesting import backtest
+from conciliacion import conciliar
+from ingesta import IngestaError, shutdown_pool
+from instrumentacion import Instrumentacion, configurar_log
+from pipeline import (
+    NOMBRE_PDF, NOMBRE_XLSX, exportar_archivos, exportar_excel, exportar_pdf, fecha_actual, guardar_historial, leer_archivos,
+    procesar
+)
+
+NOMBRE_BACKTEST = 'Backtesting_Cashflow.csv'
+NOMBRE_CONCILIACION = 'Conciliacion_Cheques.csv'
+
+
+def _fecha(valor):
+    try:
+        return pd.Timestamp(valor).normalize()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida: {valor!r} (usar AAAA-MM-DD)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genera el reporte de cashflow (XLSX y PDF) a partir de los archivos de Excel.")
+    parser.add_argument('--proyeccion', required=True, help="archivo 'Proyeccion Pagos.xlsx'")
+    parser.add_argument('--cheques', required=True, help="archivo 'Cheques.xlsx'")
+    parser.add_argument('--saldos', required=True, help="archivo 'Saldos.xlsx'")
+    parser.add_argument('--impuestos', required=True, help="archivo 'Calendario de Vencimientos Impositivos.xlsx'")
+    parser.add_argument('--cajas', required=True, help="archivo 'Saldos de Cajas.xlsx'")
+    parser.add_argument('--fecha', type=_fecha, default=None, help="fecha del reporte, AAAA-MM-DD (por defecto hoy)")
+    parser.add_argument('--salida', default='.', help="directorio donde escribir los reportes (por defecto el actual)")
+    parser.add_argument('--sin-xlsx', action='store_true', help="no generar el Excel")
+    parser.add_argument('--sin-pdf', action='store_true', help="no generar el PDF")
+    parser.add_argument('--serie', action='store_true', help="leer los archivos uno tras otro, sin procesos en paralelo")
+    parser.add_argument('--backtest', nargs=2, type=_fecha, metavar=('DESDE', 'HASTA'),
+                        help="además, escribir el reporte para cada fecha de corte entre DESDE y HASTA en " + NOMBRE_BACKTEST)
+    parser.add_argument('--conciliacion', action='store_true',
+                        help="además, escribir en " + NOMBRE_CONCILIACION + " los cheques que también figuran en la proyección de pagos")
+    parser.add_argument('--historial', default=None, metavar='DIRECTORIO',
+                        help="además, guardar los movimientos y saldos de esta fecha en el historial Parquet de DIRECTORIO")
+    parser.add_argument('--metricas', action='store_true', help="escribir en stderr los tiempos por etapa como líneas JSON")
+    parser.add_argument('--memoria', action='store_true', help="medir el pico de memoria de cada etapa (tracemalloc, más lento)")
+    parser.add_argument('--perfil', default=None, metavar='ARCHIVO', help="guardar un perfil cProfile de la ejecución en ARCHIVO")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fecha_hoy = args.fecha if args.fecha is not None else fecha_actual()
+    if args.metricas:
+        configurar_log()
+    instrumentacion = Instrumentacion(memoria=args.memoria, perfil=args.perfil is not None)
+
+    try:
+        contenidos = leer_archivos({
+            'Proyeccion': args.proyeccion,
+            'Cheques': args.cheques,
+            'Impuestos': args.impuestos,
+            'Cajas': args.cajas,
+            'Saldos': args.saldos,
+        })
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    # The process pool serves the ingestion and then the exports; it is shut down once both are done
+    try:
+        try:
+            resultado = procesar(contenidos, fecha_hoy, parallel=not args.serie, instrumentacion=instrumentacion)
+        except IngestaError as e:
+            for archivo, exc in e.errores.items():
+                print(f"Error al procesar el archivo {archivo}: {exc}", file=sys.stderr)
+            return 1
+
+        archivos = {}
+        if not args.sin_xlsx and not args.sin_pdf:
+            archivos[NOMBRE_XLSX], archivos[NOMBRE_PDF] = exportar_archivos(resultado, parallel=not args.serie)
+        elif not args.sin_xlsx:
+            archivos[NOMBRE_XLSX] = exportar_excel(resultado)
+        elif not args.sin_pdf:
+            archivos[NOMBRE_PDF] = exportar_pdf(resultado)
+    finally:
+        shutdown_pool()
+
+    os.makedirs(args.salida, exist_ok=True)
+    for nombre, datos in archivos.items():
+        ruta = os.path.join(args.salida, nombre)
+        with open(ruta, 'wb') as f:
+            f.write(datos)
+        print(ruta)
+
+    if args.backtest is not None:
+        ruta = os.path.join(args.salida, NOMBRE_BACKTEST)
+        backtest(resultado.df_total, resultado.df_saldos_clean, pd.date_range(*args.backtest)).to_csv(ruta, index=False)
+        print(ruta)
+
+    if args.conciliacion:
+        ruta = os.path.join(args.salida, NOMBRE_CONCILIACION)
+        conciliacion = conciliar(resultado.frames['Proyeccion'], resultado.frames['Cheques'])
+        pd.concat([conciliacion.coincidencias.assign(Estado='Coincide'), conciliacion.sospechosos.assign(Estado='Sospechoso')],
+                  ignore_index=True).to_csv(ruta, index=False)
+        print(ruta)
+
+    if args.historial is not None and guardar_historial(resultado, args.historial):
+        print(args.historial)
+
+    if args.perfil is not None:
+        instrumentacion.guardar_perfil(args.perfil)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Reconciliation of Cheques against Proyeccion Pagos, to catch payments counted twice.
+
+A cheque that was also loaded as a projected payment is added twice to df_total. Candidate
+pairs come from hash joins, never from comparing every cheque with every payment:
+
+- same Banco_Limpio and amount with dates at most VENTANA_DIAS apart: both sides are joined
+  on (Banco_Limpio, Importe_Centavos, block of VENTANA_DIAS + 1 days), the cheques once per
+  neighbouring block, and pairs further apart than the window are dropped;
+- the cheque number appearing as a number in the Detalle of the payment.
+
+A pair of the first kind is a match when the number or a word of the Detalles confirms it; a
+pair with the same number and amount is a match as well. The remaining candidates are
+suspicious. Matches are one to one.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from procesamiento import a_pesos
+
+VENTANA_DIAS = 3
+
+# Numbers of at least this many digits in a Detalle are taken as possible cheque numbers
+PATRON_NUMERO = r'\d{4,}'
+# Words shared by both Detalles that confirm a pair (short words and very common ones do not)
+PATRON_PALABRA = r'[a-záéíóúñü]{4,}'
+MAX_FRECUENCIA_PALABRA = 0.02
+
+COLUMNAS_PAR = [
+    'Regla', 'Banco_Limpio', 'Importe', 'Fecha Proyeccion', 'Fecha Cheque', 'Dias',
+    'Numero_Cheque', 'Detalle Proyeccion', 'Detalle Cheque', 'fila_proyeccion', 'fila_cheque',
+]
+
+
+@dataclass
+class Conciliacion:
+    coincidencias: pd.DataFrame        # one row per cheque matched to a projected payment
+    sospechosos: pd.DataFrame          # candidate pairs without enough evidence
+    cheques_sin_par: pd.DataFrame
+    proyeccion_sin_par: pd.DataFrame
+
+    @property
+    def importe_duplicado(self):
+        # Amount counted twice in df_total if every match is the same payment
+        return self.coincidencias['Importe'].sum()
+
+
+def _lado(df):
+    # Join columns of one side; 'fila' is the position of the row in its frame
+    fechas = df['Fecha'].to_numpy()
+    return pd.DataFrame({
+        'fila': np.arange(len(df)),
+        'banco': df['Banco_Limpio'].astype(str).to_numpy(),
+        'centavos': df['Importe_Centavos'].to_numpy(),
+        'dia': (fechas - np.datetime64(0, 'D')) // np.timedelta64(1, 'D'),
+    })
+
+
+def _numero(serie):
+    # Cheque numbers compare without leading zeros
+    return serie.astype(str).str.strip().str.lstrip('0')
+
+
+def _palabras(detalles):
+    # (fila, palabra) pairs without the words that are too common to tell payments apart
+    palabras = detalles.astype(str).str.lower().str.findall(PATRON_PALABRA).explode().dropna()
+    palabras = pd.DataFrame({'fila': palabras.index.to_numpy(), 'palabra': palabras.to_numpy()}).drop_duplicates()
+    frecuencia = palabras['palabra'].map(palabras['palabra'].value_counts())
+    return palabras[frecuencia <= max(1, MAX_FRECUENCIA_PALABRA * len(detalles))]
+
+
+def candidatos(df_proy, df_cheq, ventana_dias=VENTANA_DIAS):
+    """Candidate pairs (fila_p, fila_c) with their evidence flags: 'clave', 'numero' and 'palabra'."""
+    proy, cheq = _lado(df_proy), _lado(df_cheq)
+
+    # Same bank and amount, dates within the window: a cheque in block b can only pair with
+    # payments in blocks b - 1 .. b + 1
+    proy['bloque'] = proy['dia'] // (ventana_dias + 1)
+    bloques = cheq['dia'] // (ventana_dias + 1)
+    cheq_vecinos = pd.concat([cheq.assign(bloque=bloques + k) for k in (-1, 0, 1)], ignore_index=True)
+    por_clave = proy.merge(cheq_vecinos, on=['banco', 'centavos', 'bloque'], suffixes=('_p', '_c'))
+    por_clave = por_clave.loc[(por_clave['dia_p'] - por_clave['dia_c']).abs() <= ventana_dias, ['fila_p', 'fila_c']]
+
+    # Cheque number written in the Detalle of the payment
+    numeros_proy = df_proy['Detalle'].reset_index(drop=True).astype(str).str.extractall(f'({PATRON_NUMERO})')[0]
+    numeros_proy = pd.DataFrame({'fila_p': numeros_proy.index.get_level_values(0), 'numero': numeros_proy.str.lstrip('0').to_numpy()})
+    numeros_cheq = pd.DataFrame({'fila_c': cheq['fila'], 'numero': _numero(df_cheq['Numero_Cheque']).to_numpy()})
+    por_numero = numeros_proy.merge(numeros_cheq[numeros_cheq['numero'] != ''], on='numero')[['fila_p', 'fila_c']]
+
+    pares = pd.concat([por_clave.assign(clave=True, numero=False), por_numero.assign(clave=False, numero=True)], ignore_index=True)
+    pares = pares.groupby(['fila_p', 'fila_c'], as_index=False)[['clave', 'numero']].max()
+    # Typed explicitly so that no candidates still gives integer positions and boolean flags
+    pares = pares.astype({'fila_p': np.int64, 'fila_c': np.int64, 'clave': bool, 'numero': bool})
+
+    # Shared words, only checked on the candidate pairs
+    palabras_p = _palabras(df_proy['Detalle'].reset_index(drop=True)).rename(columns={'fila': 'fila_p'})
+    palabras_c = _palabras(df_cheq['Detalle'].reset_index(drop=True)).rename(columns={'fila': 'fila_c'})
+    compartidas = pares[['fila_p', 'fila_c']].merge(palabras_p, on='fila_p').merge(palabras_c, on=['fila_c', 'palabra'])
+    con_palabra = pd.MultiIndex.from_frame(compartidas[['fila_p', 'fila_c']].drop_duplicates())
+    pares['palabra'] = pd.MultiIndex.from_frame(pares[['fila_p', 'fila_c']]).isin(con_palabra)
+
+    mismo_importe = proy['centavos'].to_numpy()[pares['fila_p']] == cheq['centavos'].to_numpy()[pares['fila_c']]
+    pares['mismo_importe'] = mismo_importe
+    pares['dias'] = cheq['dia'].to_numpy()[pares['fila_c']] - proy['dia'].to_numpy()[pares['fila_p']]
+    return pares
+
+
+def _tabla_pares(pares, df_proy, df_cheq):
+    proy = df_proy.iloc[pares['fila_p'].to_numpy()]
+    cheq = df_cheq.iloc[pares['fila_c'].to_numpy()]
+    regla = np.select(
+        [pares['clave'] & pares['numero'], pares['clave'] & pares['palabra'], pares['numero'] & pares['mismo_importe'],
+         pares['clave'], pares['numero']],
+        ['Banco, importe, fecha y número', 'Banco, importe, fecha y detalle', 'Número e importe',
+         'Banco, importe y fecha', 'Número con otro importe'],
+        default=''
+    )
+    return pd.DataFrame({
+        'Regla': regla,
+        'Banco_Limpio': cheq['Banco_Limpio'].astype(str).to_numpy(),
+        'Importe': a_pesos(cheq['Importe_Centavos'].to_numpy()),
+        'Fecha Proyeccion': proy['Fecha'].to_numpy(),
+        'Fecha Cheque': cheq['Fecha'].to_numpy(),
+        'Dias': pares['dias'].to_numpy(),
+        'Numero_Cheque': cheq['Numero_Cheque'].to_numpy(),
+        'Detalle Proyeccion': proy['Detalle'].to_numpy(),
+        'Detalle Cheque': cheq['Detalle'].to_numpy(),
+        'fila_proyeccion': pares['fila_p'].to_numpy(),
+        'fila_cheque': pares['fila_c'].to_numpy(),
+    }, columns=COLUMNAS_PAR)
+
+
+def conciliar(df_proy, df_cheq, ventana_dias=VENTANA_DIAS):
+    """Match the Cheques ledger against the Proyeccion ledger (both as returned by procesar_archivo)."""
+    pares = candidatos(df_proy, df_cheq, ventana_dias)
+
+    confirmado = (pares['clave'] & (pares['numero'] | pares['palabra'])) | (pares['numero'] & pares['mismo_importe'])
+    # One to one: the strongest evidence first, then the closest dates. A pair is taken only
+    # while both sides are free, so a payment whose best cheque went to a better pair still
+    # gets its next confirmed cheque
+    pares['puntaje'] = pares['clave'].astype(int) + pares['numero'].astype(int) * 2 + pares['palabra'].astype(int)
+    pares['distancia'] = pares['dias'].abs()
+    ordenados = pares[confirmado].sort_values(
+        ['puntaje', 'distancia', 'fila_c', 'fila_p'], ascending=[False, True, True, True], kind='stable'
+    )
+
+    usados_p = np.zeros(len(df_proy), dtype=bool)
+    usados_c = np.zeros(len(df_cheq), dtype=bool)
+    elegidos = np.zeros(len(ordenados), dtype=bool)
+    for i, (fila_p, fila_c) in enumerate(zip(ordenados['fila_p'].tolist(), ordenados['fila_c'].tolist())):
+        if not usados_p[fila_p] and not usados_c[fila_c]:
+            usados_p[fila_p] = usados_c[fila_c] = elegidos[i] = True
+    coincidencias = ordenados[elegidos]
+    sospechosos = pares[~usados_p[pares['fila_p'].to_numpy()] & ~usados_c[pares['fila_c'].to_numpy()]]
+
+    return Conciliacion(
+        coincidencias=_tabla_pares(coincidencias.sort_values(['fila_c']), df_proy, df_cheq),
+        sospechosos=_tabla_pares(sospechosos.sort_values(['fila_c', 'fila_p']), df_proy, df_cheq),
+        cheques_sin_par=df_cheq[~usados_c],
+        proyeccion_sin_par=df_proy[~usados_p],
+    )
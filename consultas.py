@@ -0,0 +1,144 @@
+"""SQL over the Parquet history with an embedded DuckDB, for questions the report does not answer.
+
+DuckDB runs in the process and scans the history's Parquet files itself: filters and the
+columns a query uses are pushed into the scan, and aggregates are computed in its own
+vectorized engine, so millions of stored movements are summarized without turning them
+into a DataFrame; only the result comes back to pandas.
+
+Every query sees these views:
+
+- ``ledger``: every stored run, with its as-of date in ``Fecha_Corte`` (a movement appears once per
+  run that included it);
+- ``movimientos``: each movement once, as it stood on the first run on or after its Fecha
+  (the last run for movements dated after it), with Importe in pesos;
+- ``saldos``: the balances of every stored run.
+"""
+
+import os
+from dataclasses import dataclass
+
+import duckdb
+import pandas as pd
+
+from historial import DIRECTORIO_HISTORIAL, fechas_guardadas
+
+# Files of the committed partitions only; the '_tmp-' directories of a write in progress do not match
+_ARCHIVOS = "{tabla}/Fecha_Corte=*/Empresa=*/*.parquet"
+
+
+@dataclass(frozen=True)
+class Consulta:
+    titulo: str
+    sql: str            # with the parameters ejecutar passes: $desde, $hasta, $empresas (empty for all), $corte_desde, $corte_hasta
+
+
+# $corte_desde and $corte_hasta bound the runs that can hold movements dated in [desde, hasta]
+# (see ejecutar), so only those runs' partitions are opened
+_FILTRO = """
+    CAST(Fecha AS DATE) BETWEEN CAST($desde AS DATE) AND CAST($hasta AS DATE)
+    AND Fecha_Corte BETWEEN CAST($corte_desde AS DATE) AND CAST($corte_hasta AS DATE)
+    AND (len($empresas) = 0 OR list_contains($empresas, Empresa))
+"""
+
+CONSULTAS = {
+    'cheques_por_banco_y_semana': Consulta(
+        "Cheques por banco y semana",
+        f"""
+        SELECT Empresa, Banco_Limpio, CAST(date_trunc('week', Fecha) AS DATE) AS Semana,
+               count(*) AS Cheques, sum(Importe) AS Importe
+        FROM movimientos
+        WHERE Origen = 'Cheques' AND {_FILTRO}
+        GROUP BY ALL
+        ORDER BY Semana, Empresa, Banco_Limpio
+        """,
+    ),
+    'mayores_impuestos_por_empresa': Consulta(
+        "Mayores impuestos por Empresa",
+        f"""
+        SELECT Empresa, CAST(Fecha AS DATE) AS Fecha, Detalle, Importe
+        FROM movimientos
+        WHERE Origen = 'Impuestos' AND {_FILTRO}
+        QUALIFY row_number() OVER (PARTITION BY Empresa ORDER BY Importe DESC, Fecha, Detalle) <= 10
+        ORDER BY Empresa, Importe DESC
+        """,
+    ),
+    'totales_por_origen_y_mes': Consulta(
+        "Totales por origen y mes",
+        f"""
+        SELECT CAST(date_trunc('month', Fecha) AS DATE) AS Mes, Empresa, Origen,
+               count(*) AS Movimientos, sum(Importe) AS Importe
+        FROM movimientos
+        WHERE Origen <> 'Caja' AND {_FILTRO}
+        GROUP BY ALL
+        ORDER BY Mes, Empresa, Origen
+        """,
+    ),
+    'mayores_bancos_por_importe': Consulta(
+        "Bancos con más pagos en el período",
+        f"""
+        SELECT Empresa, Banco_Limpio, count(*) AS Movimientos, sum(Importe) AS Importe,
+               max(Importe) AS Mayor
+        FROM movimientos
+        WHERE Origen <> 'Caja' AND {_FILTRO}
+        GROUP BY ALL
+        ORDER BY Importe DESC
+        LIMIT 50
+        """,
+    ),
+}
+
+
+def _corridas(fechas):
+    # Stored as-of dates with the previous one: the run at Fecha_Corte holds the current version of
+    # the movements dated after ``anterior`` and up to it (and after it, if it is the last run)
+    corridas = pd.DataFrame({'Fecha_Corte': pd.DatetimeIndex(fechas)})
+    corridas['anterior'] = corridas['Fecha_Corte'].shift()
+    corridas['ultima'] = corridas['Fecha_Corte'] == corridas['Fecha_Corte'].iloc[-1]
+    return corridas
+
+
+def conectar(directorio=DIRECTORIO_HISTORIAL):
+    """In-memory DuckDB connection with the ``ledger``, ``movimientos`` and ``saldos`` views over the history."""
+    fechas = fechas_guardadas(directorio)
+    if not fechas:
+        raise FileNotFoundError(f"No hay historial en {directorio}")
+
+    con = duckdb.connect()
+    con.execute("SET enable_progress_bar = false")
+    for tabla in ('ledger', 'saldos'):
+        archivos = os.path.join(directorio, _ARCHIVOS.format(tabla=tabla)).replace("'", "''")
+        con.execute(f"""
+            CREATE VIEW {tabla} AS
+            SELECT * FROM read_parquet('{archivos}', hive_partitioning = true,
+                                       hive_types = {{'Fecha_Corte': DATE, 'Empresa': VARCHAR}})
+        """)
+    con.register('_corridas', _corridas(fechas))
+    # One pass over the ledger: a row is the current version of its movement when its date falls
+    # in its run's interval, so no run has to be compared with another
+    con.execute("""
+        CREATE VIEW movimientos AS
+        SELECT ledger.* EXCLUDE (Importe_Centavos), Importe_Centavos / 100 AS Importe
+        FROM ledger JOIN _corridas ON ledger.Fecha_Corte = CAST(_corridas.Fecha_Corte AS DATE)
+        WHERE (_corridas.anterior IS NULL OR CAST(ledger.Fecha AS DATE) > CAST(_corridas.anterior AS DATE))
+          AND (CAST(ledger.Fecha AS DATE) <= ledger.Fecha_Corte OR _corridas.ultima)
+    """)
+    return con
+
+
+def consultar(sql, parametros=None, directorio=DIRECTORIO_HISTORIAL):
+    """Run ``sql`` over the history's views and return the result as a DataFrame."""
+    with conectar(directorio) as con:
+        return con.execute(sql, parametros).df()
+
+
+def ejecutar(nombre, desde, hasta, empresas=(), directorio=DIRECTORIO_HISTORIAL):
+    """Run the prebuilt query ``nombre`` of CONSULTAS for movements dated in [desde, hasta]."""
+    desde, hasta = pd.Timestamp(desde).normalize(), pd.Timestamp(hasta).normalize()
+    fechas = fechas_guardadas(directorio)
+    # The current version of a movement is in the first run on or after its date, or in the last one
+    corte = lambda fecha: next((corrida for corrida in fechas if corrida >= fecha), fechas[-1]) if fechas else fecha
+    parametros = {
+        'desde': desde, 'hasta': hasta, 'empresas': list(empresas),
+        'corte_desde': corte(desde), 'corte_hasta': corte(hasta),
+    }
+    return consultar(CONSULTAS[nombre].sql, parametros, directorio)
@@ -0,0 +1,87 @@
+"""Drill-down from a cell of the report to the movements that make it up.
+
+Each source is indexed while it is aggregated (reporte.agregar_e_indexar): the row position
+of every movement under its (Empresa, Banco_Limpio, bucket) key, sorted, so the movements
+of a cell are a slice found by binary search. Desglose offsets the sources' positions by
+where each source starts in df_total, so a cell maps straight to rows of df_total without
+filtering it, and only the page on screen is built.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from procesamiento import a_pesos
+from reporte import COLUMNAS_A_CUBRIR, buckets_columna
+
+FILAS_POR_PAGINA = 50
+
+COLUMNAS_DESGLOSE = ['Fecha', 'Importe', 'Origen', 'Detalle', 'Numero_Cheque']
+
+
+@dataclass
+class PaginaDesglose:
+    movimientos: pd.DataFrame       # the rows of this page
+    pagina: int                     # 0-based, clamped to the pages there are
+    paginas: int
+    total_movimientos: int
+    importe: float                  # all the cell's movements, in pesos
+    valor: float                    # the figure in the report: importe, or Saldo Banco minus it in the A Cubrir columns
+
+
+class Desglose:
+    """Movements of ``df_total`` behind each report cell.
+
+    ``indices`` are the sources' indexes (see reporte.indexar_movimientos) paired with their
+    number of rows, in the order df_total concatenates the sources; ``df_saldos_clean``
+    gives the Saldo Banco of the A Cubrir columns.
+    """
+
+    def __init__(self, df_total, indices, fecha_hoy, df_saldos_clean):
+        self.df_total = df_total
+        self.fecha_hoy = fecha_hoy
+        self.df_saldos_clean = df_saldos_clean
+        self._indices = []
+        inicio = 0
+        for indice, filas in indices:
+            self._indices.append((indice, inicio))
+            inicio += filas
+        if inicio != len(df_total):
+            raise ValueError(f"Los índices cubren {inicio} filas y df_total tiene {len(df_total)}")
+
+    def filas(self, empresa, banco, columna):
+        """Positions in df_total of the movements in the cell (empresa, banco) x ``columna``, in ledger order."""
+        partes = []
+        for bucket in buckets_columna(columna, self.fecha_hoy):
+            for indice, inicio in self._indices:
+                try:
+                    tramo = indice.index.get_loc((empresa, banco, bucket))
+                except KeyError:
+                    continue
+                # get_loc gives a slice, or a plain position when the source's index is unique
+                partes.append(np.atleast_1d(indice['fila'].to_numpy()[tramo]) + inicio)
+        if not partes:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(partes))
+
+    def pagina(self, empresa, banco, columna, pagina=0, por_pagina=FILAS_POR_PAGINA):
+        """Page ``pagina`` of the cell's movements; only those rows of df_total are taken."""
+        filas = self.filas(empresa, banco, columna)
+        paginas = max(1, -(-len(filas) // por_pagina))
+        pagina = min(max(pagina, 0), paginas - 1)
+
+        seleccion = self.df_total.iloc[filas[pagina * por_pagina:(pagina + 1) * por_pagina]]
+        movimientos = seleccion.assign(Importe=a_pesos(seleccion['Importe_Centavos']))[COLUMNAS_DESGLOSE]
+        importe = a_pesos(self.df_total['Importe_Centavos'].to_numpy()[filas].sum())
+        valor = importe
+        if columna in COLUMNAS_A_CUBRIR:
+            valor = self.df_saldos_clean.loc[(empresa, banco), 'Saldo Banco'] - importe
+        return PaginaDesglose(
+            movimientos=movimientos.reset_index(drop=True),
+            pagina=pagina,
+            paginas=paginas,
+            total_movimientos=len(filas),
+            importe=importe,
+            valor=valor,
+        )
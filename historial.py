@@ -0,0 +1,217 @@
+"""History of every run's ledger and balances as a local Parquet dataset.
+
+Each run writes df_total and df_saldos_clean under ``<directorio>/ledger`` and
+``<directorio>/saldos``, hive-partitioned by as-of date and Empresa
+(``Fecha_Corte=2025-12-02/Empresa=BYC/...``). Running the same date again replaces that date,
+unless it is stored from the same inputs already.
+Reads go through pyarrow.dataset with the date range and companies as a partition filter
+and only the requested columns, so trends over months and the changes since the previous
+run come back without opening old Excel files, or even the other dates' files.
+
+Opening a file costs more than reading a few thousand rows of it, so the trend totals per
+Empresa are also written at save time to ``<directorio>/resumen``, one small file per date:
+a year of trend reads a few hundred files instead of every ledger partition.
+"""
+
+import contextlib
+import os
+import shutil
+import threading
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from procesamiento import COLUMNAS_LEDGER, a_pesos
+
+# Where the app keeps the history; the server's environment may point it elsewhere
+DIRECTORIO_HISTORIAL = os.environ.get('CASHFLOW_HISTORIAL', 'historial')
+
+# 'resumen' goes last: a date is complete once its summary is there
+TABLAS = ('ledger', 'saldos', 'resumen')
+PARTICIONES = pa.schema([('Fecha_Corte', pa.date32()), ('Empresa', pa.string())])
+COLUMNAS_RESUMEN = ['Saldo Banco', 'Vencido', 'A Pagar']
+
+# Next to a date's summary: the huella of the run stored for that date ('_' keeps readers off it)
+ARCHIVO_HUELLA = '_huella'
+
+# One lock per (directorio, date), so two jobs of the same date do not swap its directories at once
+_escrituras_lock = threading.Lock()
+_escrituras = {}
+
+# Columns of the ledger that identify a movement when comparing two dates
+COLUMNAS_MOVIMIENTO = [col for col in COLUMNAS_LEDGER if col != 'Empresa']
+
+
+def _particion(tabla):
+    # The summary has a handful of rows per date, so it is split by date only
+    esquema = pa.schema([PARTICIONES.field('Fecha_Corte')]) if tabla == 'resumen' else PARTICIONES
+    return ds.partitioning(esquema, flavor='hive')
+
+
+def _ruta_fecha(directorio, tabla, fecha):
+    return os.path.join(directorio, tabla, f"Fecha_Corte={fecha.date().isoformat()}")
+
+
+def _resumen(df_total, df_saldos_clean, fecha):
+    # Saldo Banco, overdue payments and payments still to come per Empresa, in pesos
+    movimientos = df_total[df_total['Origen'] != 'Caja']
+    vencido = movimientos['Fecha'] < fecha
+    centavos = movimientos['Importe_Centavos']
+    pagos = pd.DataFrame({
+        'Empresa': movimientos['Empresa'].astype(str),
+        'Vencido': centavos.where(vencido, 0), 'A Pagar': centavos.where(~vencido, 0),
+    }).groupby('Empresa').sum()
+    saldos = df_saldos_clean.reset_index()
+    saldos = saldos.assign(Empresa=saldos['Empresa'].astype(str)).groupby('Empresa')['Saldo Banco'].sum()
+    resumen = pd.concat([saldos, a_pesos(pagos)], axis=1).fillna(0)
+    return resumen[COLUMNAS_RESUMEN].rename_axis('Empresa').reset_index()
+
+
+def _lock_fecha(directorio, fecha):
+    with _escrituras_lock:
+        return _escrituras.setdefault((os.path.abspath(directorio), fecha), threading.Lock())
+
+
+def _huella_archivo(directorio, fecha):
+    return os.path.join(_ruta_fecha(directorio, TABLAS[-1], fecha), ARCHIVO_HUELLA)
+
+
+def huella_guardada(fecha_hoy, directorio=DIRECTORIO_HISTORIAL):
+    """``huella`` of the run stored for ``fecha_hoy``, or None if that date is not complete."""
+    try:
+        with open(_huella_archivo(directorio, pd.Timestamp(fecha_hoy).normalize())) as archivo:
+            return archivo.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _reemplazar(directorio, tabla, fecha, df, huella):
+    # Written next to the dataset under a '_' prefix (ignored by readers) and swapped with
+    # the stored date by two renames, so a reader never sees half a date; the old copy is
+    # moved into the same temporary directory and goes away with it, also on failure
+    temporal = os.path.join(directorio, tabla, f"_tmp-{uuid.uuid4().hex}")
+    try:
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index=False), temporal, format='parquet',
+            partitioning=_particion(tabla), basename_template='parte-{i}.parquet',
+        )
+        nuevo = _ruta_fecha(temporal, '', fecha)
+        if huella is not None:
+            with open(os.path.join(nuevo, ARCHIVO_HUELLA), 'w') as archivo:
+                archivo.write(huella)
+        destino = _ruta_fecha(directorio, tabla, fecha)
+        anterior = os.path.join(temporal, 'anterior')
+        if os.path.exists(destino):
+            os.replace(destino, anterior)
+        try:
+            os.replace(nuevo, destino)
+        except OSError:
+            if os.path.exists(anterior):
+                os.replace(anterior, destino)
+            raise
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+
+def guardar(df_total, df_saldos_clean, fecha_hoy, directorio=DIRECTORIO_HISTORIAL, huella=None):
+    """Store the ledger and balances of the run as of ``fecha_hoy``, replacing that date if present.
+
+    ``huella`` (ResultadoPipeline.huella) is kept with the date: if the date is stored with
+    the same one, nothing is written. Writes of the same date are serialized. Returns
+    whether anything was written.
+    """
+    fecha = pd.Timestamp(fecha_hoy).normalize()
+    with _lock_fecha(directorio, fecha):
+        if huella is not None and huella_guardada(fecha, directorio) == huella:
+            return False
+        # Until the new summary is in place the date is no run's in particular: a write that
+        # fails halfway must not be skipped later as already stored
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(_huella_archivo(directorio, fecha))
+
+        tablas = {
+            'ledger': df_total[COLUMNAS_LEDGER],
+            'saldos': df_saldos_clean.reset_index(),
+            'resumen': _resumen(df_total, df_saldos_clean, fecha),
+        }
+        for tabla in TABLAS:
+            df = tablas[tabla]
+            # Categoricals as plain strings: a dictionary column's index width depends on the
+            # number of categories, and dates with 5 and 300 banks could not be read together
+            categoricas = df.select_dtypes('category').columns
+            df = df.assign(Fecha_Corte=fecha.date(), **{col: df[col].astype(str) for col in ['Empresa', *categoricas]})
+            _reemplazar(directorio, tabla, fecha, df, huella if tabla == TABLAS[-1] else None)
+    return True
+
+
+def fechas_guardadas(directorio=DIRECTORIO_HISTORIAL):
+    """As-of dates in the history, oldest first (from the directory names only)."""
+    raiz = os.path.join(directorio, TABLAS[-1])
+    if not os.path.isdir(raiz):
+        return []
+    return sorted(pd.Timestamp(nombre.split('=', 1)[1]) for nombre in os.listdir(raiz) if nombre.startswith('Fecha_Corte='))
+
+
+def _cargar(tabla, desde, hasta, empresas, columnas, directorio):
+    raiz = os.path.join(directorio, tabla)
+    if not os.path.isdir(raiz):
+        raise FileNotFoundError(f"No hay historial en {raiz}")
+    dataset = ds.dataset(raiz, format='parquet', partitioning=_particion(tabla))
+
+    filtro = None
+    condiciones = []
+    if desde is not None:
+        condiciones.append(ds.field('Fecha_Corte') >= pa.scalar(pd.Timestamp(desde).date(), pa.date32()))
+    if hasta is not None:
+        condiciones.append(ds.field('Fecha_Corte') <= pa.scalar(pd.Timestamp(hasta).date(), pa.date32()))
+    if empresas is not None:
+        condiciones.append(ds.field('Empresa').isin(list(empresas)))
+    for condicion in condiciones:
+        filtro = condicion if filtro is None else filtro & condicion
+
+    if columnas is not None:
+        columnas = ['Fecha_Corte', *(col for col in columnas if col != 'Fecha_Corte')]
+    df = dataset.to_table(columns=columnas, filter=filtro).to_pandas()
+    if 'Fecha_Corte' in df.columns:
+        df['Fecha_Corte'] = pd.to_datetime(df['Fecha_Corte'])
+    return df
+
+
+def cargar_ledger(desde=None, hasta=None, empresas=None, columnas=None, directorio=DIRECTORIO_HISTORIAL):
+    """Ledger rows stored for the as-of dates in [desde, hasta], with a 'Fecha_Corte' column.
+
+    Only the partitions of those dates and ``empresas`` are opened and only ``columnas`` read.
+    """
+    return _cargar('ledger', desde, hasta, empresas, columnas, directorio)
+
+
+def tendencia(desde=None, hasta=None, empresas=None, directorio=DIRECTORIO_HISTORIAL):
+    """Per as-of date and Empresa: Saldo Banco, overdue payments and payments still to come, in pesos."""
+    resumen = _cargar('resumen', desde, hasta, empresas, ['Empresa', *COLUMNAS_RESUMEN], directorio)
+    return resumen.set_index(['Fecha_Corte', 'Empresa'])[COLUMNAS_RESUMEN].sort_index()
+
+
+def cambios(fecha_anterior, fecha_actual, empresas=None, directorio=DIRECTORIO_HISTORIAL):
+    """Movements in one date's ledger and not in the other's.
+
+    Movements are compared on every ledger column, as multisets (two identical movements
+    one day and one the next are one removal). 'Cambio' is 'Nuevo' or 'Eliminado' and
+    'Cantidad' how many copies changed.
+    """
+    fechas = [pd.Timestamp(fecha_anterior).normalize(), pd.Timestamp(fecha_actual).normalize()]
+    ledger = cargar_ledger(min(fechas), max(fechas), empresas, COLUMNAS_LEDGER, directorio)
+    ledger = ledger[ledger['Fecha_Corte'].isin(fechas)]
+
+    claves = ['Empresa', *COLUMNAS_MOVIMIENTO]
+    ledger = ledger.assign(**{col: ledger[col].astype(str) for col in ('Empresa', 'Banco_Limpio', 'Origen')})
+    conteos = ledger.groupby(['Fecha_Corte', *claves], dropna=False, observed=True).size().unstack('Fecha_Corte', fill_value=0)
+    conteos = conteos.reindex(columns=fechas, fill_value=0)
+
+    diferencia = conteos[fechas[1]] - conteos[fechas[0]]
+    diferencia = diferencia[diferencia != 0]
+    resultado = diferencia.abs().rename('Cantidad').reset_index()
+    resultado.insert(0, 'Cambio', pd.Series(diferencia.to_numpy() > 0).map({True: 'Nuevo', False: 'Eliminado'}).to_numpy())
+    resultado['Importe'] = a_pesos(resultado['Importe_Centavos'])
+    return resultado.drop(columns='Importe_Centavos').sort_values(['Cambio', 'Empresa', 'Fecha'], ignore_index=True)
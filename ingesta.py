@@ -0,0 +1,176 @@
+"""Ingestion stage: parses the five input workbooks, in parallel when possible.
+
+The parsers are CPU-bound in openpyxl and independent of each other, so cache
+misses are sent to a process pool. The pool is created lazily and kept for the
+life of the server process, since spawning workers costs more than a small file.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from cache import make_key
+from procesamiento import (
+    nombres_df, procesar_archivo, procesar_archivo_impuestos,
+    procesar_archivo_cajas, procesar_archivo_saldos
+)
+
+logger = logging.getLogger(__name__)
+
+# Order in which the inputs are parsed and errors are reported
+ARCHIVOS = ('Proyeccion', 'Cheques', 'Impuestos', 'Cajas', 'Saldos')
+
+# Below this many bytes of pending uploads the pool's IPC costs more than it saves
+PARALLEL_MIN_BYTES = 512 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class IngestaError(Exception):
+    """One or more input files could not be parsed; ``errores`` maps file -> exception in ARCHIVOS order."""
+
+    def __init__(self, errores):
+        self.errores = errores
+        detalle = '; '.join(f"{archivo}: {type(exc).__name__}: {exc}" for archivo, exc in errores.items())
+        super().__init__(f"No se pudieron procesar los archivos ({detalle})")
+
+
+def especificaciones(fecha_saldo):
+    # archivo -> (parser, args, kwargs)
+    return {
+        'Proyeccion': (procesar_archivo, (0, 2, 9, 'Proyeccion', nombres_df), {'col_detalle': 6}),
+        'Cheques': (procesar_archivo, (3, 1, 14, 'Cheques', nombres_df), {'col_detalle': 10, 'col_numero_cheque': 2}),
+        'Impuestos': (procesar_archivo_impuestos, (), {}),
+        'Cajas': (procesar_archivo_cajas, (fecha_saldo,), {}),
+        'Saldos': (procesar_archivo_saldos, (), {}),
+    }
+
+
+def claves_archivos(contenidos, fecha_saldo):
+    """Cache key of every input: its bytes plus the parser and column spec it is read with."""
+    specs = especificaciones(fecha_saldo)
+    return {archivo: make_key(contenidos[archivo], *specs[archivo]) for archivo in ARCHIVOS}
+
+
+def _parse(parser, data, args, kwargs):
+    # Runs in the worker process; returns the frame and the seconds it took
+    inicio = time.perf_counter()
+    df = parser(io.BytesIO(data), *args, **kwargs)
+    return df, time.perf_counter() - inicio
+
+
+def get_pool(max_workers=None):
+    # Shared by every session's background job and by the exports (see pipeline.exportar_archivos), hence the lock
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' because the Streamlit server is multi-threaded and forking it is unsafe
+            max_workers = max_workers or min(len(ARCHIVOS), os.cpu_count() or 1)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def _ingestar_serie(tareas, al_terminar):
+    resultados, errores = {}, {}
+    for archivo, (parser, data, args, kwargs) in tareas.items():
+        try:
+            resultados[archivo] = _parse(parser, data, args, kwargs)
+        except Exception as exc:
+            errores[archivo] = exc
+            continue
+        al_terminar(archivo, *resultados[archivo])
+    return resultados, errores
+
+
+def _ingestar_paralelo(tareas, al_terminar, max_workers=None):
+    pool = get_pool(max_workers)
+    futuros = {pool.submit(_parse, parser, data, args, kwargs): archivo for archivo, (parser, data, args, kwargs) in tareas.items()}
+    resultados, errores = {}, {}
+    try:
+        for futuro in as_completed(futuros):
+            archivo = futuros[futuro]
+            try:
+                resultados[archivo] = futuro.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as exc:
+                errores[archivo] = exc
+                continue
+            al_terminar(archivo, *resultados[archivo])
+    except BaseException:
+        # e.g. a cancelled run: files not started yet are dropped from the pool's queue
+        for futuro in futuros:
+            futuro.cancel()
+        raise
+    return resultados, errores
+
+
+def ingestar_archivos(contenidos, fecha_saldo, cache=None, parallel=True, max_workers=None, instrumentacion=None, claves=None):
+    """Parse the uploads in ``contenidos`` (archivo -> bytes) and return archivo -> normalized DataFrame.
+
+    Files found in ``cache`` are not parsed again. Remaining files go to the process pool when
+    ``parallel`` is set, there is more than one of them, more than one CPU and at least
+    PARALLEL_MIN_BYTES to parse; otherwise (or if the pool cannot be used) they are parsed one
+    after another. Raises IngestaError listing every failing file.
+
+    With ``instrumentacion`` the parse time and rows of every file are recorded as
+    ``leer_<archivo>`` stages as soon as the file is read (cache hits with zero seconds), so a
+    cancelled run stops after the file being read. ``claves`` takes the keys from
+    claves_archivos when the caller already has them.
+    """
+    specs = especificaciones(fecha_saldo)
+    resultados, tareas = {}, {}
+    if cache is not None and claves is None:
+        claves = claves_archivos(contenidos, fecha_saldo)
+
+    for archivo in ARCHIVOS:
+        parser, args, kwargs = specs[archivo]
+        data = contenidos[archivo]
+        if cache is not None:
+            df = cache.lookup(claves[archivo])
+            if df is not None:
+                resultados[archivo] = df
+                if instrumentacion is not None:
+                    instrumentacion.registrar(f'leer_{archivo}', 0.0, len(df), en_cache=True)
+                continue
+        tareas[archivo] = (parser, data, args, kwargs)
+
+    def al_terminar(archivo, df, segundos):
+        if instrumentacion is not None:
+            instrumentacion.registrar(f'leer_{archivo}', segundos, len(df))
+
+    pendientes = sum(len(data) for _, data, _, _ in tareas.values())
+    if parallel and len(tareas) > 1 and (os.cpu_count() or 1) > 1 and pendientes >= PARALLEL_MIN_BYTES:
+        try:
+            parseados, errores = _ingestar_paralelo(tareas, al_terminar, max_workers)
+        except (BrokenProcessPool, OSError) as exc:
+            logger.warning("Process pool unavailable (%s), parsing files serially", exc)
+            shutdown_pool()
+            parseados, errores = _ingestar_serie(tareas, al_terminar)
+    else:
+        parseados, errores = _ingestar_serie(tareas, al_terminar)
+
+    if errores:
+        raise IngestaError({archivo: errores[archivo] for archivo in ARCHIVOS if archivo in errores})
+
+    for archivo, (df, segundos) in parseados.items():
+        if cache is not None:
+            cache.store(claves[archivo], df)
+            df = df.copy()
+        resultados[archivo] = df
+
+    return {archivo: resultados[archivo] for archivo in ARCHIVOS}
@@ -0,0 +1,166 @@
+"""Per-stage wall time, row counts and peak memory of a pipeline run.
+
+Every stage is logged as one JSON line on the ``cashflow.metricas`` logger, so slow
+reports can be traced from the server logs, and kept in ``etapas`` for the UI.
+Peak memory (tracemalloc) is opt-in because tracing slows the parsers noticeably; it
+only sees allocations of this process, not of the ingestion pool's workers. tracemalloc
+is process-wide, so it is started by the first measured stage and stopped by the last
+one, and the peak is only reset when no other stage is measuring: a stage that overlaps
+another (a nested stage, or another job) reports the peak since the older one started,
+an upper bound. A run can also be recorded with cProfile.
+
+A run in a background job is cancelled through its Instrumentacion: once ``cancelar()``
+is called, the next stage that starts or is recorded raises Cancelado.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+import pandas as pd
+
+logger = logging.getLogger('cashflow.metricas')
+
+# Stages measuring memory right now, in any thread; tracemalloc runs while there is one
+_traza_lock = threading.Lock()
+_trazas_activas = 0
+
+
+@dataclass
+class Etapa:
+    nombre: str
+    segundos: float = 0.0
+    filas: int | None = None
+    pico_mb: float | None = None
+    en_cache: bool = False
+
+
+class Cancelado(Exception):
+    """The run was cancelled; raised at the boundary of the next stage."""
+
+
+def configurar_log(stream=None):
+    # Send the JSON lines to stderr (or ``stream``) unless a handler was configured already
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _iniciar_traza():
+    global _trazas_activas
+    with _traza_lock:
+        _trazas_activas += 1
+        if _trazas_activas == 1:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+
+
+def _terminar_traza():
+    # Peak bytes seen since the stage started (or since an overlapping one did)
+    global _trazas_activas
+    with _traza_lock:
+        pico = tracemalloc.get_traced_memory()[1]
+        _trazas_activas -= 1
+        if _trazas_activas == 0:
+            tracemalloc.stop()
+        return pico
+
+
+class Instrumentacion:
+    """Collects the stages of one run; ``memoria`` turns on tracemalloc, ``perfil`` cProfile."""
+
+    def __init__(self, memoria=False, perfil=False):
+        self.memoria = memoria
+        self.corrida = uuid.uuid4().hex[:8]
+        self.etapas = []
+        self.en_curso = None    # name of the stage running now, for progress reports
+        self._perfil = cProfile.Profile() if perfil else None
+        self._cancelado = threading.Event()
+
+    def cancelar(self):
+        self._cancelado.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    def comprobar(self):
+        # Called at every stage boundary; may also be called inside long stages
+        if self._cancelado.is_set():
+            raise Cancelado(f"Ejecución {self.corrida} cancelada")
+
+    def registrar(self, nombre, segundos, filas=None, pico_mb=None, en_cache=False):
+        self.comprobar()
+        etapa = Etapa(nombre, segundos, filas, pico_mb, en_cache)
+        self._emitir(etapa)
+        return etapa
+
+    def _emitir(self, etapa):
+        self.etapas.append(etapa)
+        logger.info(json.dumps({'evento': 'etapa', 'corrida': self.corrida, **asdict(etapa)}, ensure_ascii=False))
+
+    @contextmanager
+    def etapa(self, nombre, memoria=None):
+        """Time the block; the caller may set ``filas`` on the yielded Etapa.
+
+        ``memoria`` overrides the run's setting for this stage only.
+        """
+        self.comprobar()
+        etapa = Etapa(nombre)
+        anterior, self.en_curso = self.en_curso, nombre
+        # Read once: the tracing started here is the one stopped below
+        memoria = self.memoria if memoria is None else memoria
+        if memoria:
+            _iniciar_traza()
+
+        inicio = time.perf_counter()
+        try:
+            yield etapa
+        finally:
+            etapa.segundos = time.perf_counter() - inicio
+            self.en_curso = anterior
+            if memoria:
+                etapa.pico_mb = _terminar_traza() / 2**20
+            self._emitir(etapa)
+
+    @contextmanager
+    def perfilar(self):
+        # No-op unless the run was created with perfil=True
+        if self._perfil is None:
+            yield
+            return
+        self._perfil.enable()
+        try:
+            yield
+        finally:
+            self._perfil.disable()
+
+    @property
+    def perfilando(self):
+        return self._perfil is not None
+
+    def guardar_perfil(self, ruta):
+        # pstats/snakeviz-compatible dump
+        self._perfil.dump_stats(ruta)
+
+    def resumen_perfil(self, limite=30, orden='cumulative'):
+        salida = io.StringIO()
+        pstats.Stats(self._perfil, stream=salida).sort_stats(orden).print_stats(limite)
+        return salida.getvalue()
+
+    def tabla(self):
+        return pd.DataFrame([asdict(etapa) for etapa in self.etapas], columns=list(Etapa.__dataclass_fields__))
@@ -0,0 +1,282 @@
+"""Headless cashflow pipeline: ingest -> aggregate -> export.
+
+Every stage takes the as-of date explicitly and nothing here imports streamlit,
+so the pipeline can be imported, timed or run in batch (see cli.py). app.py is
+just a UI on top of these functions.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
+
+import pandas as pd
+import pyarrow as pa
+
+from exportar import generar_excel, generar_pdf
+from cache import fingerprint
+from desglose import Desglose
+import historial
+from ingesta import ARCHIVOS, claves_archivos, get_pool, ingestar_archivos, shutdown_pool
+from instrumentacion import Instrumentacion
+from procesamiento import a_pesos, concatenar_ledger, tabla_cajas
+from reporte import agregar_e_indexar, combinar_agregados
+
+logger = logging.getLogger(__name__)
+
+# Columns of the 'Base' sheet (future movements, one row each)
+COLUMNAS_BASE = ['Empresa', 'Banco_Limpio', 'Fecha', 'Importe', 'Origen', 'Detalle', 'Numero_Cheque']
+
+NOMBRE_XLSX = 'Resumen_Cashflow_Formateado.xlsx'
+NOMBRE_PDF = 'Resumen_Cashflow_Formateado.pdf'
+
+# Inputs that are movements (aggregated into the report); Saldos only enters the final combination
+FUENTES_MOVIMIENTOS = ('Proyeccion', 'Cheques', 'Impuestos', 'Cajas')
+
+# From this many 'Base' rows the Excel and the PDF are rendered at the same time in the process pool;
+# below it the pickling and the pool's IPC cost more than the overlap saves
+EXPORT_PARALLEL_MIN_ROWS = 5000
+
+# Stages procesar records, in order (for progress reports)
+ETAPAS_PROCESAR = (
+    *(f'leer_{archivo}' for archivo in ARCHIVOS),
+    *(f'agregar_{archivo}' for archivo in FUENTES_MOVIMIENTOS),
+    'reporte',
+)
+
+
+@dataclass
+class ResultadoPipeline:
+    """Result of procesar. ``huella`` identifies the inputs and the date (it keys the exports);
+    ``indices`` holds each movements source's index by report cell (for ``desglose``).
+    ``df_total``, ``df_pivot_base`` and ``desglose`` are only built the first time they are used."""
+    fecha_hoy: pd.Timestamp
+    frames: dict
+    reporte_final: pd.DataFrame
+    instrumentacion: Instrumentacion
+    huella: str
+    indices: dict
+
+    @cached_property
+    def _movimientos(self):
+        with self.instrumentacion.etapa('combinar') as etapa:
+            df_total, df_pivot_base = combinar_movimientos(self.frames, self.fecha_hoy)
+            etapa.filas = len(df_total)
+        return df_total, df_pivot_base
+
+    @property
+    def df_total(self):
+        return self._movimientos[0]
+
+    @property
+    def df_pivot_base(self):
+        return self._movimientos[1]
+
+    @cached_property
+    def desglose(self):
+        # Sources in the order combinar_movimientos concatenates them into df_total
+        indices = [(self.indices[archivo], len(self.frames[archivo])) for archivo in FUENTES_MOVIMIENTOS]
+        return Desglose(self.df_total, indices, self.fecha_hoy, self.df_saldos_clean)
+
+    @property
+    def df_cajas(self):
+        # Display table (CAJA, Importe, Detalle); the ledger rows are in frames['Cajas']
+        return tabla_cajas(self.frames['Cajas'])
+
+    @property
+    def df_saldos_clean(self):
+        return self.frames['Saldos']
+
+
+def fecha_actual():
+    # Today at midnight, the default as-of date of the report
+    return pd.to_datetime(datetime.now().date())
+
+
+def normalizar_fecha(fecha):
+    return pd.Timestamp(fecha).normalize()
+
+
+def leer_archivos(rutas):
+    """Read the input files from disk; ``rutas`` maps archivo (see ingesta.ARCHIVOS) -> path."""
+    contenidos = {}
+    for archivo, ruta in rutas.items():
+        with open(ruta, 'rb') as f:
+            contenidos[archivo] = f.read()
+    return contenidos
+
+
+def huella_entradas(contenidos, fecha_hoy, claves=None):
+    """Fingerprint of the five inputs and the date: the ``huella`` procesar gives its result.
+
+    ``claves`` are the inputs' claves_archivos, when the caller has them already.
+    """
+    fecha_hoy = normalizar_fecha(fecha_hoy)
+    if claves is None:
+        claves = claves_archivos(contenidos, fecha_hoy)
+    return fingerprint(*(claves[archivo] for archivo in ARCHIVOS), fecha_hoy)
+
+
+def combinar_movimientos(frames, fecha_hoy):
+    """Return ``(df_total, df_pivot_base)`` from the parsed input frames.
+
+    ``df_total`` is the ledger (see procesamiento.COLUMNAS_LEDGER); ``df_pivot_base`` has the
+    'Base' sheet columns, with Importe back in pesos.
+    """
+    # Create df_total from the processed dataframes (balances from Saldos.xlsx are kept apart)
+    df_total = concatenar_ledger([frames[archivo] for archivo in FUENTES_MOVIMIENTOS])
+
+    # Create df_pivot_base for future payments
+    # Exclude 'Caja' origin from df_pivot_base
+    df_pivot_base = df_total[(df_total['Fecha'] >= fecha_hoy) & (df_total['Origen'] != 'Caja')]
+    df_pivot_base = df_pivot_base.assign(Importe=a_pesos(df_pivot_base['Importe_Centavos']))[COLUMNAS_BASE]
+
+    return df_total, df_pivot_base
+
+
+def agregar_fuente(archivo, df, fecha_hoy, clave=None, cache=None, instrumentacion=None):
+    """Partial aggregate of one movements source and its index by report cell, as ``(parcial, indice)``.
+
+    Both are reused from ``cache`` when ``clave`` (the source's file key) is known.
+    """
+    claves_cache = None
+    if clave is not None:
+        claves_cache = (fingerprint(clave, 'agregado', fecha_hoy), fingerprint(clave, 'indice', fecha_hoy))
+    if cache is not None and claves_cache is not None:
+        parcial, indice = (cache.lookup(clave_cache) for clave_cache in claves_cache)
+        if parcial is not None and indice is not None:
+            if instrumentacion is not None:
+                instrumentacion.registrar(f'agregar_{archivo}', 0.0, len(df), en_cache=True)
+            return parcial, indice
+
+    if instrumentacion is None:
+        instrumentacion = Instrumentacion()
+    with instrumentacion.etapa(f'agregar_{archivo}') as etapa:
+        parcial, indice = agregar_e_indexar(df, fecha_hoy)
+        etapa.filas = len(df)
+    if cache is not None and claves_cache is not None:
+        cache.store(claves_cache[0], parcial.copy())
+        cache.store(claves_cache[1], indice.copy())
+    return parcial, indice
+
+
+def procesar(contenidos, fecha_hoy, cache=None, parallel=True, instrumentacion=None, cache_agregados=None):
+    """Ingest the five inputs (archivo -> bytes) and aggregate them into the report as of ``fecha_hoy``.
+
+    Parsed files are reused from ``cache`` and each source's partial aggregate and index from
+    ``cache_agregados`` (both ParseCache), keyed by the file content: when only one input
+    changed, only that file is parsed and aggregated again before the final combination.
+
+    The stages are recorded in ``instrumentacion`` (a new Instrumentacion if not given),
+    which the result keeps. Raises ingesta.IngestaError if any file cannot be parsed.
+    """
+    if instrumentacion is None:
+        instrumentacion = Instrumentacion()
+    fecha_hoy = normalizar_fecha(fecha_hoy)
+    claves = claves_archivos(contenidos, fecha_hoy)
+
+    with instrumentacion.perfilar():
+        with instrumentacion.etapa('ingesta') as etapa:
+            frames = ingestar_archivos(contenidos, fecha_hoy, cache=cache, parallel=parallel,
+                                       instrumentacion=instrumentacion, claves=claves)
+            etapa.filas = sum(len(df) for df in frames.values())
+
+        parciales, indices = {}, {}
+        for archivo in FUENTES_MOVIMIENTOS:
+            parciales[archivo], indices[archivo] = agregar_fuente(
+                archivo, frames[archivo], fecha_hoy, claves[archivo], cache_agregados, instrumentacion
+            )
+        with instrumentacion.etapa('reporte') as etapa:
+            reporte_final = combinar_agregados(list(parciales.values()), frames['Saldos'], fecha_hoy)
+            etapa.filas = len(reporte_final)
+
+    huella = huella_entradas(contenidos, fecha_hoy, claves)
+    return ResultadoPipeline(fecha_hoy, frames, reporte_final, instrumentacion, huella, indices)
+
+
+def exportar_excel(resultado, instrumentacion=None, memoria=None):
+    # Recorded in the run's own instrumentation unless another one is given; ``memoria``
+    # overrides its setting for this stage (see Instrumentacion.etapa)
+    if instrumentacion is None:
+        instrumentacion = resultado.instrumentacion
+    with instrumentacion.perfilar(), instrumentacion.etapa('excel', memoria) as etapa:
+        datos = generar_excel(resultado.reporte_final, resultado.df_pivot_base, resultado.df_cajas, resultado.fecha_hoy).getvalue()
+        etapa.filas = len(resultado.df_pivot_base)
+    return datos
+
+
+def exportar_pdf(resultado, instrumentacion=None, memoria=None):
+    if instrumentacion is None:
+        instrumentacion = resultado.instrumentacion
+    with instrumentacion.perfilar(), instrumentacion.etapa('pdf', memoria) as etapa:
+        datos = generar_pdf(resultado.reporte_final, resultado.df_cajas, resultado.fecha_hoy).getvalue()
+        etapa.filas = len(resultado.reporte_final)
+    return datos
+
+
+def _renderizar(generar, args):
+    # Runs in a worker process (or inline); returns the file's bytes and the seconds it took
+    inicio = time.perf_counter()
+    datos = generar(*args).getvalue()
+    return datos, time.perf_counter() - inicio
+
+
+def exportar_archivos(resultado, instrumentacion=None, parallel=True):
+    """Return ``(xlsx, pdf)`` bytes, rendered at the same time when the report is big enough.
+
+    With ``parallel``, more than one CPU and at least EXPORT_PARALLEL_MIN_ROWS 'Base' rows, the
+    two files are rendered in the ingestion process pool (xlsxwriter and fpdf2 are pure Python,
+    so threads would not overlap); otherwise, or if the pool cannot be used, one after another.
+    Both generators stamp the report date, so the bytes are the same either way. The render
+    times are recorded as the 'excel' and 'pdf' stages, and the wall time as 'exportar'.
+    """
+    if instrumentacion is None:
+        instrumentacion = resultado.instrumentacion
+    trabajos = {
+        'excel': (generar_excel, (resultado.reporte_final, resultado.df_pivot_base, resultado.df_cajas, resultado.fecha_hoy)),
+        'pdf': (generar_pdf, (resultado.reporte_final, resultado.df_cajas, resultado.fecha_hoy)),
+    }
+
+    with instrumentacion.perfilar(), instrumentacion.etapa('exportar') as etapa:
+        renderizados = None
+        if parallel and (os.cpu_count() or 1) > 1 and len(resultado.df_pivot_base) >= EXPORT_PARALLEL_MIN_ROWS:
+            try:
+                pool = get_pool()
+                futuros = {nombre: pool.submit(_renderizar, generar, args) for nombre, (generar, args) in trabajos.items()}
+                renderizados = {nombre: futuro.result() for nombre, futuro in futuros.items()}
+            except (BrokenProcessPool, OSError) as exc:
+                logger.warning("Process pool unavailable (%s), rendering exports serially", exc)
+                shutdown_pool()
+        if renderizados is None:
+            renderizados = {nombre: _renderizar(generar, args) for nombre, (generar, args) in trabajos.items()}
+
+        instrumentacion.registrar('excel', renderizados['excel'][1], len(resultado.df_pivot_base))
+        instrumentacion.registrar('pdf', renderizados['pdf'][1], len(resultado.reporte_final))
+        etapa.filas = len(resultado.df_pivot_base)
+    return renderizados['excel'][0], renderizados['pdf'][0]
+
+
+def guardar_historial(resultado, directorio=historial.DIRECTORIO_HISTORIAL, instrumentacion=None):
+    """Add the run's ledger and balances to the Parquet history (stage 'historial').
+
+    The history is a by-product of the report: if it cannot be written, the failure is
+    logged and the report goes on. Returns whether the run is in the history (a date
+    already stored from the same inputs is not written again).
+    """
+    if instrumentacion is None:
+        instrumentacion = resultado.instrumentacion
+    with instrumentacion.etapa('historial') as etapa:
+        try:
+            escrito = historial.guardar(
+                resultado.df_total, resultado.df_saldos_clean, resultado.fecha_hoy, directorio, resultado.huella,
+            )
+        except (OSError, pa.ArrowException) as exc:
+            logger.warning("Could not write the history to %s (%s)", directorio, exc)
+            return False
+        etapa.filas = len(resultado.df_total)
+        # Stored from the same inputs by an earlier run
+        etapa.en_cache = not escrito
+    return True
@@ -0,0 +1,332 @@
+"""Reading and normalization of the input workbooks of the cashflow report."""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.io.parsers import TextParser
+from pandas.api.types import union_categoricals
+
+# ==========================================
+# PARTE 1: PROCESAMIENTO DE DATOS
+# ==========================================
+
+# Data de correlación incrustada directamente
+data_nombres = {
+    'Cheques': [
+        'BBVA FRANCES BYC', 'BBVA FRANCES MPZ', 'BBVA FRANCES MBZ', 'BBVA FRANCES MGX',
+        'BBVA FRANCES RG2', 'CREDICOOP BYC', 'CREDICOOP MGX', 'CREDICOOP MBZ',
+        'CREDICOOP TMX', 'DE LA NACION ARG. BYC', 'DE LA NACION ARG MGX',
+        'PATAGONIA MBZ', 'SANTANDER RIO BYC', 'SANTANDER RIO MBZ',
+        'SANTANDER MGXD', 'MERCADO PAGO BYC', 'MERCADO PAGO MGX', 'MERCADO PAGO MBZ'
+    ],
+    'Proyeccion Pagos': [
+        'Bco BBVA BYC SA', 'Bco BBVA MPZ BYC SA', 'Bco BBVA MBZ SRL', 'Bco BBVA MGXD SRL',
+        'Bco BBVA RG2', 'Bco Credicoop BYC SA', 'Bco Credicoop MGXD SRL', 'Bco Credicoop MBZ SRL',
+        'Bco Credicoop TMX SRL', 'Bco Nacion BYC SA', 'Bco Nacion MGXD SRL',
+        'Bco Patagonia MBZ SRL', 'Bco Santander BYC SA', 'Bco Santander MBZ SRL',
+        'Bco Santander MGXD SRL', 'MercadoPago BYC', 'MercadoPago MGX', 'MercadoPago MBZ'
+    ],
+    'EMPRESA': [
+        'BYC', 'BYC', 'MBZ', 'MGX',
+        'BYC', 'BYC', 'MGX', 'MBZ',
+        'TMX', 'BYC', 'MGX',
+        'MBZ', 'BYC', 'MBZ',
+        'MGX', 'BYC', 'MGX', 'MBZ'
+    ]
+}
+nombres_df = pd.DataFrame(data_nombres)
+
+# Cell texts read as missing (pandas' default NA strings, passed to TextParser explicitly so the
+# Proyeccion filter and the parser agree whatever the pandas version)
+VALORES_NA = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+})
+
+# Create a robust mapping dictionary from nombres_df
+bank_mapping_dict = {}
+for idx, row in nombres_df.iterrows():
+    canonical_banco = row['Proyeccion Pagos'].strip() # Assume this is the canonical name
+    empresa = row['EMPRESA'].strip()
+
+    # Map from Cheques name to (canonical_banco, empresa)
+    raw_cheque_name = row['Cheques'].strip()
+    bank_mapping_dict[raw_cheque_name] = (canonical_banco, empresa)
+
+    # Map from Proyeccion Pagos name to (canonical_banco, empresa)
+    bank_mapping_dict[canonical_banco] = (canonical_banco, empresa)
+
+# Lookup tables built once from bank_mapping_dict / nombres_df so whole columns can be
+# resolved with a single vectorized map
+banco_limpio_lookup = pd.Series({raw: mapped[0] for raw, mapped in bank_mapping_dict.items()})
+empresa_lookup = pd.Series({raw: mapped[1] for raw, mapped in bank_mapping_dict.items()})
+
+# Default 'Banco_Limpio' per 'EMPRESA': the first 'Proyeccion Pagos' bank of each company
+empresa_to_default_bank = nombres_df.groupby('EMPRESA')['Proyeccion Pagos'].first().to_dict()
+
+def resolve_bank_columns(raw_bank_names):
+    # (Banco_Limpio, Empresa) of every name, matched after stripping; unmatched names keep the
+    # raw name and get 'UNKNOWN'
+    keys = raw_bank_names.str.strip()
+    banco_limpio = keys.map(banco_limpio_lookup).fillna(raw_bank_names)
+    empresa = keys.map(empresa_lookup).fillna('UNKNOWN')
+    return banco_limpio, empresa
+
+# Canonical schema of the movements ledger. Every procesar_* parser of movements returns exactly
+# these columns, so the concat of the four sources only stitches arrays: company, bank and origin
+# are categoricals, Fecha is datetime64[ns] and amounts are whole cents in int64.
+COLUMNAS_LEDGER = ['Empresa', 'Banco_Limpio', 'Fecha', 'Importe_Centavos', 'Origen', 'Detalle', 'Numero_Cheque']
+COLUMNAS_CATEGORICAS = ['Empresa', 'Banco_Limpio']
+ORIGENES = pd.CategoricalDtype(['Proyeccion', 'Cheques', 'Impuestos', 'Caja'])
+
+def a_centavos(importes):
+    # Pesos (float, no NaN) -> int64 cents, rounded to the nearest cent
+    return np.round(np.asarray(importes, dtype='float64') * 100).astype('int64')
+
+def a_pesos(centavos):
+    return centavos / 100
+
+def a_ledger(df, origen):
+    """Canonical ledger frame from ``df`` with Empresa, Banco_Limpio, Fecha, Importe (pesos), Detalle and Numero_Cheque.
+
+    Fecha is normalized to midnight, so every view that counts days from fecha_hoy (the
+    report's buckets, the projection, the backtest and the simulation) puts a movement
+    with a time of day on the same day.
+    """
+    return pd.DataFrame({
+        'Empresa': df['Empresa'].astype(str).astype('category'),
+        'Banco_Limpio': df['Banco_Limpio'].astype(str).astype('category'),
+        'Fecha': df['Fecha'].astype('datetime64[ns]').dt.normalize(),
+        'Importe_Centavos': a_centavos(df['Importe']),
+        'Origen': pd.Categorical.from_codes(np.full(len(df), ORIGENES.categories.get_loc(origen), dtype=np.int8), dtype=ORIGENES),
+        'Detalle': df['Detalle'].astype(str),
+        'Numero_Cheque': df['Numero_Cheque'].astype(str),
+    }, index=df.index)
+
+def concatenar_ledger(frames):
+    """Concatenate ledger frames keeping the categoricals (their categories are unified first)."""
+    frames = list(frames)
+    for col in COLUMNAS_CATEGORICAS:
+        categorias = union_categoricals([f[col].array for f in frames]).categories
+        frames = [f.assign(**{col: f[col].cat.set_categories(categorias)}) for f in frames]
+    return pd.concat(frames)
+
+def tabla_cajas(df_cajas):
+    # 'Saldos de Cajas' as shown in the app, the Excel and the PDF (the caja name is the Detalle)
+    return pd.DataFrame({
+        'CAJA': df_cajas['Detalle'],
+        'Importe': a_pesos(df_cajas['Importe_Centavos']),
+        'Detalle': df_cajas['Detalle'],
+    })
+
+# Estados of the Calendario Impositivo that are still to be paid
+ESTADOS_IMPUESTOS_PENDIENTES = ('VENCIDO', 'A PAGAR')
+
+def _convert_cell(value):
+    # Same conversion pandas' openpyxl reader applies before type inference
+    if value is None:
+        return ''
+    if isinstance(value, str) and value in ERROR_CODES:
+        return float('nan')
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _ancho_fila(row):
+    # Position after the last non-empty cell
+    for i in range(len(row) - 1, -1, -1):
+        if row[i] is not None and row[i] != '':
+            return i + 1
+    return 0
+
+def leer_columnas_excel(file_object_or_path, columnas, filtro=None, texto=()):
+    """Stream the first sheet in read-only mode keeping only the ``columnas`` positions.
+
+    The first row is the header, as in ``pd.read_excel``. ``filtro`` receives a dict
+    position -> cell value and rows it rejects are never materialized. The result has one
+    column per position, named by the position, with pandas' usual type inference except
+    for the ``texto`` positions, which keep the cell values as they are (so a cheque number
+    stays ``123`` instead of becoming ``123.0`` when the column has blanks).
+    """
+    columnas = list(columnas)
+    filas = []
+    blancos_pendientes = 0
+    # Like df.iloc, positions past the last used column of the sheet are an error
+    max_col = max(columnas)
+    ancho_suficiente = False
+
+    wb = load_workbook(file_object_or_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, ()) # Header row
+        ancho_suficiente = _ancho_fila(header) > max_col
+
+        for row in rows:
+            if all(v is None or v == '' for v in row):
+                # Blank rows only count if more data follows (pandas trims trailing ones)
+                blancos_pendientes += 1
+                continue
+
+            if not ancho_suficiente:
+                ancho_suficiente = _ancho_fila(row) > max_col
+
+            if blancos_pendientes:
+                fila_vacia = {c: '' for c in columnas}
+                if filtro is None or filtro(fila_vacia):
+                    filas.extend([[''] * len(columnas)] * blancos_pendientes)
+                blancos_pendientes = 0
+
+            fila = {c: _convert_cell(row[c]) if c < len(row) else '' for c in columnas}
+            if filtro is None or filtro(fila):
+                filas.append([fila[c] for c in columnas])
+    finally:
+        wb.close()
+
+    if not ancho_suficiente:
+        raise IndexError(f"El archivo no tiene la columna {max_col + 1} (se esperaban al menos {max_col + 1} columnas)")
+
+    return TextParser(
+        filas, header=None, names=columnas, skip_blank_lines=False, dtype={c: object for c in texto},
+        na_values=list(VALORES_NA), keep_default_na=False,
+    ).read()
+
+def procesar_archivo(file_object_or_path, col_banco, col_fecha, col_importe, tipo_origen, nombres_map_df, col_detalle=None, col_numero_cheque=None):
+    columnas = [c for c in (col_banco, col_fecha, col_importe, col_detalle, col_numero_cheque) if c is not None]
+
+    # NEW CONDITIONAL FILTER: Only for 'Proyeccion' files, filter where column H (index 7) is empty
+    filtro = None
+    if tipo_origen == 'Proyeccion':
+        columnas.append(7)
+        filtro = lambda fila: pd.isna(fila[7]) or fila[7] in VALORES_NA # Keep rows where column H is NaN
+
+    texto = [c for c in (col_banco, col_detalle, col_numero_cheque) if c is not None]
+    df = leer_columnas_excel(file_object_or_path, list(dict.fromkeys(columnas)), filtro, texto)
+
+    df_clean = pd.DataFrame({
+        'Banco_Raw': df[col_banco].astype(str).str.strip(),
+        'Fecha': pd.to_datetime(df[col_fecha], errors='coerce'),
+        'Importe': pd.to_numeric(df[col_importe], errors='coerce'),
+        'Origen': tipo_origen
+    })
+    # Drop rows where 'Importe', 'Banco_Raw', or 'Fecha' are NaN (after coercion)
+    df_clean = df_clean.dropna(subset=['Importe', 'Banco_Raw', 'Fecha'])
+
+    if col_detalle is not None:
+        df_clean['Detalle'] = df[col_detalle].astype(str).str.strip()
+    else:
+        df_clean['Detalle'] = '' # Default empty string if no detail column
+
+    if col_numero_cheque is not None:
+        df_clean['Numero_Cheque'] = df[col_numero_cheque].astype(str).str.strip()
+    else:
+        df_clean['Numero_Cheque'] = '' # Default empty string if no cheque number column
+
+    # Apply the centralized mapping
+    df_clean['Banco_Limpio'], df_clean['Empresa'] = resolve_bank_columns(df_clean['Banco_Raw'])
+
+    return a_ledger(df_clean, tipo_origen)
+
+def procesar_archivo_impuestos(file_object_or_path):
+    # Filter based on 'Estado' while reading, so paid taxes are never loaded
+    df = leer_columnas_excel(
+        file_object_or_path, [1, 2, 5, 6, 11],
+        lambda fila: isinstance(fila[11], str) and fila[11].strip() in ESTADOS_IMPUESTOS_PENDIENTES,
+        texto=[1, 2]
+    )
+
+    # Extract data from specified columns
+    df_impuestos_clean = pd.DataFrame({
+        'Empresa_Raw': df[2].astype(str).str.strip(), # Column C
+        'Fecha': pd.to_datetime(df[5], errors='coerce'), # Column F
+        'Importe': pd.to_numeric(df[6], errors='coerce'), # Column G
+        'Estado': df[11].astype(str).str.strip(), # Column L
+        'Detalle': df[1].astype(str).str.strip() # Column B for Detalle
+    })
+
+    # Convert 'Importe' to numeric
+    # df_impuestos_clean['Importe'] = df_impuestos_clean['Importe'] * -1 # REMOVED: User wants positive sign
+
+    # Add empty 'Numero_Cheque' column for consistency
+    df_impuestos_clean['Numero_Cheque'] = ''
+
+    # Apply mapping (empresa_to_default_bank is precomputed at module level) to create 'Banco_Limpio' and handle 'UNKNOWN'
+    df_impuestos_clean['Banco_Limpio'] = df_impuestos_clean['Empresa_Raw'].map(empresa_to_default_bank)
+    df_impuestos_clean['Banco_Limpio'] = df_impuestos_clean['Banco_Limpio'].fillna('UNKNOWN')
+
+    # Rename Empresa_Raw to Empresa for consistency and select final columns
+    df_impuestos_clean = df_impuestos_clean.rename(columns={'Empresa_Raw': 'Empresa'})
+    df_impuestos_clean = df_impuestos_clean.dropna(subset=['Importe', 'Empresa', 'Banco_Limpio', 'Fecha'])
+
+    return a_ledger(df_impuestos_clean, 'Impuestos')
+
+# NEW FUNCTION FOR SALDOS CAJAS
+def procesar_archivo_cajas(file_object_or_path, fecha_saldo=None):
+    if fecha_saldo is None:
+        fecha_saldo = pd.to_datetime(datetime.now().date())
+
+    # Read the Excel file, skipping the first 6 rows (header is at row 7, which is index 6)
+    df = pd.read_excel(file_object_or_path, header=6)
+
+    # Create a new DataFrame from the relevant columns (B and D, original indices 1 and 3)
+    df_cajas_clean = pd.DataFrame({
+        'Nombre_Caja': df.iloc[:, 1].astype(str).str.strip(),        # Original Column B
+        'Saldo_Caja': pd.to_numeric(df.iloc[:, 3], errors='coerce')  # Original Column D
+    })
+
+    # Define the list of allowed box names (instead of numbers)
+    allowed_box_names = [
+        'TESORERIA',
+        'SMT - ENCARGADO',
+        'MPZ ENCARGADO',
+        'AKN - ENCARGADO',
+        'ZT2 - ENCARGADO',
+        'BRC - ENCARGADO',
+        'BR2 - ENCARGADO',
+        'RGL - ENCARGADO',
+        'RG2 - ENCARGADO',
+        'RESERVA'
+    ]
+
+    # Filter the DataFrame to include only allowed box names and drop NaN 'Saldo_Caja' values
+    df_cajas_clean = df_cajas_clean[
+        df_cajas_clean['Nombre_Caja'].isin(allowed_box_names)
+    ].dropna(subset=['Saldo_Caja']).copy()
+
+    # Order the DataFrame by the specified list of box names
+    df_cajas_clean['Nombre_Caja'] = pd.Categorical(df_cajas_clean['Nombre_Caja'], categories=allowed_box_names, ordered=True)
+    df_cajas_clean = df_cajas_clean.sort_values('Nombre_Caja')
+
+    # Transform df_cajas_clean to the ledger schema (the 'CAJA' column for display is the Detalle, see tabla_cajas)
+    df_cajas_output = pd.DataFrame({
+        'Empresa': df_cajas_clean['Nombre_Caja'], # Defaulting Empresa to Caja Name for now
+        'Banco_Limpio': 'Caja ' + df_cajas_clean['Nombre_Caja'].astype(str), # Consistent naming
+        'Fecha': fecha_saldo,
+        'Importe': df_cajas_clean['Saldo_Caja'],
+        'Detalle': df_cajas_clean['Nombre_Caja'], # Using Caja Name as Detalle
+        'Numero_Cheque': ''
+    })
+
+    return a_ledger(df_cajas_output, 'Caja')
+
+def procesar_archivo_saldos(file_object_or_path):
+    df_saldos = pd.read_excel(file_object_or_path)
+
+    # Map original column indices to new names as per instruction
+    df_saldos_clean = pd.DataFrame({
+        'Banco_Raw_Saldos': df_saldos.iloc[:, 0].astype(str).str.strip(), # Column A for Banco
+        'Saldo FCI': pd.to_numeric(df_saldos.iloc[:, 1], errors='coerce'),  # Column B for Saldo FCI
+        'Saldo Banco': pd.to_numeric(df_saldos.iloc[:, 2], errors='coerce')  # Column C for Saldo Banco
+    })
+    df_saldos_clean = df_saldos_clean.dropna(subset=['Saldo FCI', 'Saldo Banco'])
+
+    # Apply the centralized mapping to saldos data
+    df_saldos_clean['Banco_Limpio'], df_saldos_clean['Empresa'] = resolve_bank_columns(df_saldos_clean['Banco_Raw_Saldos'])
+
+    df_saldos_clean = df_saldos_clean[['Empresa', 'Banco_Limpio', 'Saldo FCI', 'Saldo Banco']].drop_duplicates()
+    df_saldos_clean = df_saldos_clean.set_index(['Empresa', 'Banco_Limpio'])
+
+    return df_saldos_clean
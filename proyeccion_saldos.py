@@ -0,0 +1,151 @@
+"""Rolling projection of the bank balances over a configurable horizon.
+
+The weekly report stops at today + 5 days; this projects every account of Saldos.xlsx
+day by day up to ``Horizonte.dias`` and shows it daily for the first days, then by
+week, then by month. Payments are accumulated into a dense (cuenta x día) matrix with
+one bincount over the ledger and the balances are its cumulative sum, so the cost is
+linear in the movements and a 365-day horizon over every bank stays interactive.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from procesamiento import a_centavos
+
+UN_DIA = np.timedelta64(1, 'D')
+
+
+@dataclass(frozen=True)
+class Horizonte:
+    """``dias`` projected in total: ``dias_diarios`` one by one, then ``semanas`` weeks, then months."""
+    dias: int = 90
+    dias_diarios: int = 14
+    semanas: int = 4
+
+    def __post_init__(self):
+        if self.dias < 1 or self.dias_diarios < 0 or self.semanas < 0:
+            raise ValueError(f"Horizonte inválido: {self}")
+
+
+@dataclass
+class ProyeccionSaldos:
+    fecha_hoy: pd.Timestamp
+    saldo_inicial: pd.Series      # Saldo Banco minus the overdue payments, per account
+    pagos: pd.DataFrame           # payments per period (columns), per account (rows)
+    saldos: pd.DataFrame          # balance at the end of each period
+    saldos_diarios: pd.DataFrame  # balance at the end of every day of the horizon
+    primer_negativo: pd.Series    # first day with a negative balance (NaT if none)
+
+    def resumen(self):
+        # Accounts with their first negative day, opening balance and end-of-period balances
+        return pd.concat([
+            self.primer_negativo.rename('Primer Día Negativo'),
+            self.saldo_inicial.rename('Saldo Inicial'),
+            self.saldos,
+        ], axis=1)
+
+
+def periodos(fecha_hoy, horizonte):
+    """Return ``(inicios, etiquetas)``: the first day of every period, as days since ``fecha_hoy``, and its label."""
+    fecha_hoy = pd.Timestamp(fecha_hoy).normalize()
+    inicios, etiquetas = [], []
+
+    dia = 0
+    while dia < min(horizonte.dias_diarios, horizonte.dias):
+        inicios.append(dia)
+        etiquetas.append((fecha_hoy + pd.Timedelta(days=dia)).strftime('%d-%b'))
+        dia += 1
+
+    for _ in range(horizonte.semanas):
+        if dia >= horizonte.dias:
+            break
+        inicios.append(dia)
+        etiquetas.append('Sem ' + (fecha_hoy + pd.Timedelta(days=dia)).strftime('%d-%b'))
+        dia += 7
+
+    # Months run from the same day of the month (today + dia, + 1 month, ...)
+    inicio_meses = fecha_hoy + pd.Timedelta(days=dia)
+    mes = 0
+    while dia < horizonte.dias:
+        inicios.append(dia)
+        etiquetas.append('Mes ' + (inicio_meses + pd.DateOffset(months=mes)).strftime('%d-%b'))
+        mes += 1
+        dia = ((inicio_meses + pd.DateOffset(months=mes)) - fecha_hoy).days
+
+    return np.array(inicios, dtype=np.int64), etiquetas
+
+
+def saldos_por_cuenta(df_saldos_clean):
+    # Saldo Banco per (Empresa, Banco_Limpio); accounts listed more than once are added up
+    return df_saldos_clean['Saldo Banco'].groupby(level=[0, 1], sort=False).sum()
+
+
+def cuentas_movimientos(df_total, cuentas):
+    # Position in ``cuentas`` of every movement (-1 when its account is not in Saldos.xlsx),
+    # resolved on the categorical codes: one lookup per (Empresa, Banco_Limpio) category pair
+    empresa = df_total['Empresa'].array
+    banco = df_total['Banco_Limpio'].array
+    n_bancos = len(banco.categories)
+
+    tabla = np.full(len(empresa.categories) * n_bancos + 1, -1, dtype=np.int64)
+    codigos_empresa = empresa.categories.get_indexer(cuentas.get_level_values(0))
+    codigos_banco = banco.categories.get_indexer(cuentas.get_level_values(1))
+    conocidas = (codigos_empresa >= 0) & (codigos_banco >= 0)
+    tabla[codigos_empresa[conocidas] * n_bancos + codigos_banco[conocidas]] = np.flatnonzero(conocidas)
+
+    pares = empresa.codes.astype(np.int64) * n_bancos + banco.codes
+    pares[(empresa.codes < 0) | (banco.codes < 0)] = len(tabla) - 1
+    return tabla[pares]
+
+
+def proyectar(df_total, df_saldos_clean, fecha_hoy, horizonte=Horizonte()):
+    """Project the balance of every account in ``df_saldos_clean`` over ``horizonte``.
+
+    The opening balance is Saldo Banco minus the overdue payments (as 'A Cubrir Vencido');
+    every movement within the horizon, whatever its origin except Caja balances, is paid on
+    its date. Accounts listed more than once in Saldos.xlsx are added up.
+    """
+    fecha_hoy = pd.Timestamp(fecha_hoy).normalize()
+    dias = horizonte.dias
+
+    saldo_banco = saldos_por_cuenta(df_saldos_clean)
+    cuentas = saldo_banco.index
+    n_cuentas = len(cuentas)
+
+    movimientos = df_total[df_total['Origen'] != 'Caja']
+    cuenta = cuentas_movimientos(movimientos, cuentas)
+    dia = (movimientos['Fecha'].to_numpy() - np.datetime64(fecha_hoy, 'ns')) // UN_DIA
+    centavos = movimientos['Importe_Centavos'].to_numpy()
+
+    en_cuenta = cuenta >= 0
+    vencido = np.bincount(cuenta[en_cuenta & (dia < 0)], weights=centavos[en_cuenta & (dia < 0)], minlength=n_cuentas)
+
+    en_horizonte = en_cuenta & (dia >= 0) & (dia < dias)
+    pagos_diarios = np.bincount(cuenta[en_horizonte] * dias + dia[en_horizonte], weights=centavos[en_horizonte],
+                                minlength=n_cuentas * dias).reshape(n_cuentas, dias)
+
+    apertura = a_centavos(saldo_banco.to_numpy()) - vencido
+    saldos_diarios = apertura[:, None] - np.cumsum(pagos_diarios, axis=1)
+
+    inicios, etiquetas = periodos(fecha_hoy, horizonte)
+    finales = np.append(inicios[1:], dias) - 1
+    pagos = np.add.reduceat(pagos_diarios, inicios, axis=1)
+
+    negativo = saldos_diarios < 0
+    primer_dia = np.where(negativo.any(axis=1), negativo.argmax(axis=1), -1)
+    primer_negativo = pd.Series(
+        pd.DatetimeIndex(np.where(primer_dia >= 0, np.datetime64(fecha_hoy, 'D') + primer_dia, np.datetime64('NaT'))),
+        index=cuentas
+    )
+
+    fechas = pd.date_range(fecha_hoy, periods=dias, freq='D')
+    return ProyeccionSaldos(
+        fecha_hoy=fecha_hoy,
+        saldo_inicial=pd.Series(apertura / 100, index=cuentas),
+        pagos=pd.DataFrame(pagos / 100, index=cuentas, columns=etiquetas),
+        saldos=pd.DataFrame(saldos_diarios[:, finales] / 100, index=cuentas, columns=etiquetas),
+        saldos_diarios=pd.DataFrame(saldos_diarios / 100, index=cuentas, columns=fechas),
+        primer_negativo=primer_negativo,
+    )
@@ -0,0 +1,154 @@
+"""Aggregation of the combined movements into the cashflow report.
+
+Every movement gets a bucket code in one vectorized pass (Vencido, one of the
+days of the week, Emitidos or none) and one groupby/unstack per ledger gives its
+partial aggregate. The report adds the partial aggregates up and aligns them to
+the balances from Saldos.xlsx. The same bucket codes index the movements of each
+ledger by report cell, for the drill-down (see desglose.py).
+"""
+
+import numpy as np
+import pandas as pd
+
+DIAS_SEMANA = 6
+
+dias_es_full = {0:'Lunes', 1:'Martes', 2:'Miércoles', 3:'Jueves', 4:'Viernes', 5:'Sábado', 6:'Domingo'}
+
+# Bucket codes; days of the week are BUCKET_PRIMER_DIA .. BUCKET_PRIMER_DIA + DIAS_SEMANA - 1
+BUCKET_NINGUNO = -1
+BUCKET_VENCIDO = 0
+BUCKET_PRIMER_DIA = 1
+BUCKET_EMITIDOS = BUCKET_PRIMER_DIA + DIAS_SEMANA
+
+# Report columns that are Saldo Banco minus the movements of their buckets
+COLUMNAS_A_CUBRIR = ['A Cubrir Vencido', 'A Cubrir Semana']
+
+
+def columnas_dias(fecha_hoy):
+    # Column labels of the days of the week, e.g. '02-Dec\nMartes', one per date instead of per movement
+    fechas = pd.date_range(fecha_hoy, periods=DIAS_SEMANA, freq='D')
+    return (fechas.strftime('%d-%b') + '\n' + fechas.weekday.map(dias_es_full)).tolist()
+
+
+def columnas_buckets(fecha_hoy):
+    # Report columns in bucket-code order
+    return ['Vencido'] + columnas_dias(fecha_hoy) + ['Emitidos']
+
+
+def asignar_buckets(fechas, origenes, fecha_hoy):
+    """Return the bucket code of every movement as an int8 array.
+
+    - Vencido: Fecha < fecha_hoy (any origin)
+    - Day i: fecha_hoy <= Fecha <= fecha_hoy + 5 days, i = whole days since fecha_hoy
+    - Emitidos: later than the week, Cheques only
+    """
+    fechas = np.asarray(fechas, dtype='datetime64[ns]')
+    hoy = np.datetime64(pd.Timestamp(fecha_hoy), 'ns')
+    limite = hoy + np.timedelta64(DIAS_SEMANA - 1, 'D')
+
+    # NaT (blank dates) fall in no bucket; errstate only silences their invalid division
+    with np.errstate(invalid='ignore'):
+        dias = (fechas - hoy) // np.timedelta64(1, 'D')
+    buckets = np.full(len(fechas), BUCKET_NINGUNO, dtype=np.int8)
+    buckets[fechas < hoy] = BUCKET_VENCIDO
+    semana = (fechas >= hoy) & (fechas <= limite)
+    buckets[semana] = BUCKET_PRIMER_DIA + dias[semana]
+    buckets[(fechas > limite) & (np.asarray(origenes) == 'Cheques')] = BUCKET_EMITIDOS
+    return buckets
+
+
+def agregar_movimientos(df, fecha_hoy):
+    """Partial aggregate of a ledger frame: int64 cents per (Empresa, Banco_Limpio) row and bucket-code column.
+
+    Partial aggregates of disjoint ledgers add up, so each source can be aggregated (and
+    cached) on its own and only combinar_agregados runs when another input changes.
+    """
+    return _agregar(df, asignar_buckets(df['Fecha'], df['Origen'], fecha_hoy))
+
+
+def agregar_e_indexar(df, fecha_hoy):
+    """``(agregar_movimientos(df, fecha_hoy), indexar_movimientos(df, buckets))`` with one bucket assignment."""
+    buckets = asignar_buckets(df['Fecha'], df['Origen'], fecha_hoy)
+    return _agregar(df, buckets), indexar_movimientos(df, buckets)
+
+
+def _agregar(df, buckets):
+    en_bucket = buckets != BUCKET_NINGUNO
+
+    # Movements outside every bucket are left out; grouping on the categorical arrays keeps
+    # the groupby on integer codes, and only the (small) result is turned into labels
+    sumas = df['Importe_Centavos'].to_numpy()[en_bucket]
+    sumas = pd.Series(sumas).groupby(
+        [df['Empresa'].array[en_bucket], df['Banco_Limpio'].array[en_bucket], buckets[en_bucket]], observed=True
+    ).sum()
+    if len(sumas):
+        parcial = sumas.unstack(fill_value=0)
+        parcial.index = pd.MultiIndex.from_arrays([parcial.index.get_level_values(i).astype(object) for i in range(2)])
+    else:
+        parcial = pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []]), dtype='int64')
+    return parcial.reindex(columns=range(BUCKET_EMITIDOS + 1), fill_value=0)
+
+
+def indexar_movimientos(df, buckets):
+    """Row position ('fila') of every movement of ``df`` in a bucket, indexed by (Empresa, Banco_Limpio, bucket).
+
+    The index is sorted (stably, so positions stay in ledger order within a key): the
+    movements of one report cell are a contiguous slice that ``index.get_loc`` finds by
+    binary search.
+    """
+    en_bucket = buckets != BUCKET_NINGUNO
+    indice = pd.DataFrame(
+        {'fila': np.flatnonzero(en_bucket)},
+        index=pd.MultiIndex.from_arrays(
+            [df['Empresa'].array[en_bucket], df['Banco_Limpio'].array[en_bucket], buckets[en_bucket]],
+            names=['Empresa', 'Banco_Limpio', 'bucket']
+        ),
+    )
+    return indice.sort_index(kind='stable')
+
+
+def buckets_columna(columna, fecha_hoy):
+    """Bucket codes of the movements behind report column ``columna`` (none for the balances)."""
+    columnas = columnas_buckets(fecha_hoy)
+    if columna in columnas:
+        return [columnas.index(columna)]
+    dias = list(range(BUCKET_PRIMER_DIA, BUCKET_EMITIDOS))
+    derivadas = {
+        'Total Semana': dias,
+        'A Cubrir Vencido': [BUCKET_VENCIDO],
+        'A Cubrir Semana': [BUCKET_VENCIDO, *dias],
+    }
+    return derivadas.get(columna, [])
+
+
+def combinar_agregados(parciales, df_saldos_clean, fecha_hoy):
+    """Build ``reporte_final`` from partial aggregates (see agregar_movimientos) and the balances
+    indexed by (Empresa, Banco_Limpio)."""
+    columnas_bucket = columnas_buckets(fecha_hoy)
+    expected_day_columns = columnas_bucket[BUCKET_PRIMER_DIA:BUCKET_EMITIDOS]
+
+    # Cents of every source added up per account, back to pesos once
+    ancho = pd.concat(parciales).groupby(level=[0, 1], sort=False).sum() / 100
+    ancho.columns = columnas_bucket
+
+    # Align to the banks in Saldos.xlsx (the report only shows those)
+    ancho.index.names = df_saldos_clean.index.names
+    ancho = ancho.reindex(df_saldos_clean.index, fill_value=0).fillna(0)
+
+    reporte_final = pd.concat([df_saldos_clean[['Saldo Banco', 'Saldo FCI']], ancho], axis=1)
+    reporte_final['Total Semana'] = reporte_final[expected_day_columns].sum(axis=1)
+
+    # Calcular 'A Cubrir Vencido' como (Saldo Banco - Vencido)
+    reporte_final['A Cubrir Vencido'] = reporte_final['Saldo Banco'] - reporte_final['Vencido']
+
+    # Calculate 'A Cubrir Semana' (formerly 'Disponible Futuro')
+    reporte_final['A Cubrir Semana'] = reporte_final['Saldo Banco'] - reporte_final['Vencido'] - reporte_final['Total Semana']
+
+    columnas = ['Saldo Banco', 'Saldo FCI', 'Vencido'] + expected_day_columns + ['Total Semana', 'Emitidos', 'A Cubrir Vencido', 'A Cubrir Semana']
+    return reporte_final[columnas]
+
+
+def construir_reporte(df_total, df_saldos_clean, fecha_hoy):
+    """Build ``reporte_final`` from the movements ledger (see procesamiento.COLUMNAS_LEDGER) and the
+    balances indexed by (Empresa, Banco_Limpio)."""
+    return combinar_agregados([agregar_movimientos(df_total, fecha_hoy)], df_saldos_clean, fecha_hoy)
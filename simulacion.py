@@ -0,0 +1,126 @@
+"""Monte Carlo simulation of cheque clearing and payment slippage over the report week.
+
+'A Cubrir Semana' assumes every movement is paid exactly on its Fecha. Here each movement
+of the week gets a random delay in days drawn from the distribution of its origin, for
+thousands of scenarios at once: delays are drawn as (escenarios x movimientos) arrays in
+chunks of scenarios and the amounts are added into a (escenario, cuenta, día) array with
+one bincount per chunk. Delays only push payments later, so movements dated after the
+week cannot land in it and are left out; overdue payments stay in the opening balance,
+as in 'A Cubrir Vencido'.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from procesamiento import a_centavos
+from proyeccion_saldos import UN_DIA, cuentas_movimientos, saldos_por_cuenta
+from reporte import DIAS_SEMANA
+
+
+@dataclass(frozen=True)
+class Demora:
+    """Discrete delay distribution: ``dias[i]`` days late with probability ``probabilidades[i]``."""
+    dias: tuple
+    probabilidades: tuple
+
+    def __post_init__(self):
+        if len(self.dias) != len(self.probabilidades) or not np.isclose(sum(self.probabilidades), 1):
+            raise ValueError(f"Distribución de demora inválida: {self}")
+
+
+# Delay per Origen; origins not listed are paid on their date
+DEMORAS_POR_DEFECTO = {
+    'Cheques': Demora(dias=(0, 1, 2, 3, 5), probabilidades=(0.55, 0.25, 0.10, 0.05, 0.05)),
+    'Proyeccion': Demora(dias=(0, 1, 2, 7), probabilidades=(0.70, 0.10, 0.10, 0.10)),
+}
+
+# Upper bound of escenarios x movimientos drawn at once, to cap the memory per chunk
+ELEMENTOS_POR_BLOQUE = 4_000_000
+
+
+@dataclass
+class ResultadoSimulacion:
+    escenarios: int
+    fechas: pd.DatetimeIndex
+    saldo_inicial: pd.Series        # Saldo Banco minus Vencido, per account
+    bandas: pd.DataFrame            # percentiles of the end-of-day balance, per (Empresa, Banco_Limpio, Fecha)
+    prob_negativo: pd.Series        # share of scenarios where the account goes negative within the week
+
+    def banda(self, cuenta):
+        # Percentile bands of one account with the dates as index, e.g. for a chart
+        return self.bandas.xs(tuple(cuenta), level=[0, 1])
+
+
+def simular(df_total, df_saldos_clean, fecha_hoy, escenarios=10_000, demoras=None, semilla=None, percentiles=(5, 50, 95)):
+    """Simulate the daily balances of the report week under random delays per origin."""
+    fecha_hoy = pd.Timestamp(fecha_hoy).normalize()
+    demoras = DEMORAS_POR_DEFECTO if demoras is None else demoras
+    rng = np.random.default_rng(semilla)
+
+    saldo_banco = saldos_por_cuenta(df_saldos_clean)
+    cuentas = saldo_banco.index
+    n_cuentas = len(cuentas)
+
+    movimientos = df_total[df_total['Origen'] != 'Caja']
+    cuenta = cuentas_movimientos(movimientos, cuentas)
+    dia = (movimientos['Fecha'].to_numpy() - np.datetime64(fecha_hoy, 'ns')) // UN_DIA
+    centavos = movimientos['Importe_Centavos'].to_numpy().astype('float64')
+    origen = movimientos['Origen'].to_numpy()
+
+    en_cuenta = cuenta >= 0
+    vencido = np.bincount(cuenta[en_cuenta & (dia < 0)], weights=centavos[en_cuenta & (dia < 0)], minlength=n_cuentas)
+    apertura = a_centavos(saldo_banco.to_numpy()) - vencido
+
+    semana = en_cuenta & (dia >= 0) & (dia < DIAS_SEMANA)
+    cuenta, dia, centavos, origen = cuenta[semana], dia[semana], centavos[semana], origen[semana]
+
+    # One lookup table of delays per origin, indexed by a uniform 16-bit draw (probabilities are
+    # resolved to 1/65536); origins without a distribution always get 0 days
+    nombres_origen, codigo_origen = np.unique(origen.astype(str), return_inverse=True)
+    sorteos = np.arange(1 << 16)
+    tablas = np.zeros((len(nombres_origen), 1 << 16), dtype=np.int64)
+    for i, nombre in enumerate(nombres_origen):
+        demora = demoras.get(nombre)
+        if demora is not None:
+            limites = np.cumsum(demora.probabilidades)[:-1] * (1 << 16)
+            tablas[i] = np.asarray(demora.dias, dtype=np.int64)[np.searchsorted(limites, sorteos, side='right')]
+
+    # An extra day per account collects whatever is pushed past the week and is dropped at the end
+    dias = DIAS_SEMANA + 1
+    celdas = n_cuentas * dias
+    celda = cuenta * dias + dia
+    atraso_maximo = DIAS_SEMANA - dia
+    pagos = np.zeros(escenarios * celdas)
+
+    bloque = max(1, ELEMENTOS_POR_BLOQUE // max(len(celda), 1))
+    for inicio in range(0, escenarios, bloque):
+        filas = min(bloque, escenarios - inicio)
+        sorteo = np.frombuffer(rng.bytes(2 * filas * len(celda)), dtype=np.uint16).reshape(filas, len(celda))
+        destino = tablas[codigo_origen, sorteo]
+        np.minimum(destino, atraso_maximo, out=destino)
+        destino += celda
+        destino += (np.arange(filas, dtype=np.int64) * celdas)[:, None]
+        pagos[inicio * celdas:(inicio + filas) * celdas] += np.bincount(
+            destino.ravel(), weights=np.broadcast_to(centavos, destino.shape).ravel(), minlength=filas * celdas
+        )
+
+    pagos = pagos.reshape(escenarios, n_cuentas, dias)[:, :, :DIAS_SEMANA]
+    saldos = apertura[None, :, None] - np.cumsum(pagos, axis=2)
+
+    fechas = pd.date_range(fecha_hoy, periods=DIAS_SEMANA, freq='D')
+    bandas = np.percentile(saldos, percentiles, axis=0) / 100  # (percentil, cuenta, día)
+    indice = pd.MultiIndex.from_arrays([
+        np.repeat(cuentas.get_level_values(0), DIAS_SEMANA),
+        np.repeat(cuentas.get_level_values(1), DIAS_SEMANA),
+        np.tile(fechas, n_cuentas),
+    ], names=[cuentas.names[0], cuentas.names[1], 'Fecha'])
+
+    return ResultadoSimulacion(
+        escenarios=escenarios,
+        fechas=fechas,
+        saldo_inicial=pd.Series(apertura / 100, index=cuentas),
+        bandas=pd.DataFrame({f'P{p:g}': banda.reshape(-1) for p, banda in zip(percentiles, bandas)}, index=indice),
+        prob_negativo=pd.Series((saldos.min(axis=2) < 0).mean(axis=0), index=cuentas, name='Prob. Negativo'),
+    )
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from desglose import Desglose
+from reporte import COLUMNAS_A_CUBRIR, agregar_e_indexar, asignar_buckets, columnas_buckets, construir_reporte
+
+FECHA_HOY = pd.Timestamp('2026-10-19')
+
+
+def _fuente(origen, filas):
+    # filas: (Empresa, Banco_Limpio, days after fecha_hoy, cents)
+    empresas, bancos, dias, centavos = zip(*filas)
+    return pd.DataFrame({
+        'Empresa': pd.Categorical(empresas),
+        'Banco_Limpio': pd.Categorical(bancos),
+        'Fecha': FECHA_HOY + pd.to_timedelta(dias, unit='D'),
+        'Importe_Centavos': np.array(centavos, dtype=np.int64),
+        'Origen': origen,
+        'Detalle': [f"{origen} {i}" for i in range(len(filas))],
+        'Numero_Cheque': '',
+    })
+
+
+def _columna(df):
+    # Report column of the source's first movement
+    return columnas_buckets(FECHA_HOY)[asignar_buckets(df['Fecha'], df['Origen'], FECHA_HOY)[0]]
+
+
+def _saldos(cuentas):
+    # cuentas: (Empresa, Banco_Limpio, Saldo Banco)
+    empresas, bancos, saldos = zip(*cuentas)
+    return pd.DataFrame({
+        'Empresa': pd.Categorical(empresas),
+        'Banco_Limpio': pd.Categorical(bancos),
+        'Saldo FCI': 0.0,
+        'Saldo Banco': saldos,
+    }).set_index(['Empresa', 'Banco_Limpio'])
+
+
+SALDOS = _saldos([('BYC', 'Galicia', 100.0), ('BYC', 'Nacion', 50.0)])
+
+
+def _desglose(fuentes, df_saldos_clean=SALDOS):
+    indices = [(agregar_e_indexar(df, FECHA_HOY)[1], len(df)) for df in fuentes]
+    return Desglose(pd.concat(fuentes, ignore_index=True), indices, FECHA_HOY, df_saldos_clean)
+
+
+def test_celda_con_un_solo_movimiento():
+    # Every cell of this source has one movement, so its index is unique
+    cheques = _fuente('Cheques', [('BYC', 'Galicia', 0, 1500), ('BYC', 'Nacion', 1, 2500)])
+    desglose = _desglose([cheques])
+    columna = _columna(cheques)
+
+    pagina = desglose.pagina('BYC', 'Galicia', columna)
+    assert pagina.total_movimientos == 1
+    assert pagina.importe == 15.0
+    assert pagina.movimientos['Detalle'].tolist() == ['Cheques 0']
+
+
+def test_celda_repartida_entre_fuentes():
+    # One movement from a unique-indexed source and two from another, in df_total order
+    proyeccion = _fuente('Proyeccion', [('BYC', 'Galicia', 0, 100), ('BYC', 'Galicia', 0, 200), ('BYC', 'Nacion', 0, 50)])
+    cheques = _fuente('Cheques', [('BYC', 'Galicia', 0, 1000)])
+    desglose = _desglose([proyeccion, cheques])
+    columna = _columna(cheques)
+
+    np.testing.assert_array_equal(desglose.filas('BYC', 'Galicia', columna), [0, 1, 3])
+    assert desglose.pagina('BYC', 'Galicia', columna).importe == 13.0
+    assert len(desglose.filas('BYC', 'Santander', columna)) == 0
+
+
+@pytest.mark.parametrize('columna', COLUMNAS_A_CUBRIR)
+def test_columnas_a_cubrir(columna):
+    # The cell is Saldo Banco minus its movements; importe stays the movements' total
+    proyeccion = _fuente('Proyeccion', [('BYC', 'Galicia', -3, 1000), ('BYC', 'Galicia', 1, 2500), ('BYC', 'Nacion', 2, 700)])
+    desglose = _desglose([proyeccion])
+    reporte = construir_reporte(desglose.df_total, SALDOS, FECHA_HOY)
+
+    for banco in ('Galicia', 'Nacion'):
+        pagina = desglose.pagina('BYC', banco, columna)
+        assert pagina.valor == pytest.approx(reporte.loc[('BYC', banco), columna])
+        assert pagina.importe == pytest.approx(SALDOS.loc[('BYC', banco), 'Saldo Banco'] - pagina.valor)
+    assert desglose.pagina('BYC', 'Galicia', 'A Cubrir Vencido').importe == 10.0
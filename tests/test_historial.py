@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+import consultas
+import historial
+from procesamiento import ORIGENES
+
+
+def _guardar(directorio, fecha, bancos):
+    # A run with one movement and one balance per bank
+    bancos = [f"Banco {i}" for i in range(bancos)]
+    df_total = pd.DataFrame({
+        'Empresa': pd.Categorical(['BYC'] * len(bancos)),
+        'Banco_Limpio': pd.Categorical(bancos),
+        'Fecha': pd.Timestamp(fecha),
+        'Importe_Centavos': np.arange(len(bancos), dtype=np.int64),
+        'Origen': pd.Categorical(['Cheques'] * len(bancos), dtype=ORIGENES),
+        'Detalle': 'Pago',
+        'Numero_Cheque': '',
+    })
+    df_saldos_clean = pd.DataFrame({
+        'Empresa': pd.Categorical(['BYC'] * len(bancos)),
+        'Banco_Limpio': pd.Categorical(bancos),
+        'Saldo FCI': 0.0,
+        'Saldo Banco': 1.0,
+    }).set_index(['Empresa', 'Banco_Limpio'])
+    historial.guardar(df_total, df_saldos_clean, fecha, directorio)
+
+
+def test_fechas_con_distinta_cantidad_de_bancos(tmp_path):
+    # 5 banks fit a dictionary index of int8 and 300 do not; both dates must read together
+    _guardar(tmp_path, '2026-10-01', 5)
+    _guardar(tmp_path, '2026-10-02', 300)
+
+    ledger = historial.cargar_ledger(directorio=tmp_path)
+    assert len(ledger) == 305
+    assert ledger['Banco_Limpio'].nunique() == 300
+    assert historial.tendencia(directorio=tmp_path)['Saldo Banco'].tolist() == [5.0, 300.0]
+    assert (historial.cambios('2026-10-01', '2026-10-02', directorio=tmp_path)['Cambio'] == 'Nuevo').sum() == 300
+
+    bancos = consultas.consultar("SELECT count(DISTINCT Banco_Limpio) AS bancos FROM ledger", directorio=str(tmp_path))
+    assert bancos['bancos'].tolist() == [300]
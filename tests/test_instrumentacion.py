@@ -0,0 +1,23 @@
+import tracemalloc
+
+import instrumentacion
+from instrumentacion import Instrumentacion
+
+
+def test_memoria_cambiada_durante_una_etapa():
+    # The setting read at the start of the stage is the one its end uses
+    for memoria in (True, False):
+        metricas = Instrumentacion(memoria=memoria)
+        with metricas.etapa('excel'):
+            metricas.memoria = not memoria
+        assert instrumentacion._trazas_activas == 0
+        assert not tracemalloc.is_tracing()
+        assert (metricas.etapas[-1].pico_mb is not None) == memoria
+
+
+def test_memoria_por_etapa():
+    metricas = Instrumentacion()
+    with metricas.etapa('pdf', memoria=True):
+        assert tracemalloc.is_tracing()
+    assert metricas.etapas[-1].pico_mb is not None
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,91 @@
+import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from procesamiento import a_ledger, leer_columnas_excel
+from proyeccion_saldos import Horizonte, proyectar
+from reporte import columnas_buckets, construir_reporte
+
+FECHA_HOY = pd.Timestamp('2026-10-19')
+
+
+def test_fecha_con_hora_en_el_ultimo_dia_de_la_semana():
+    # 10:00 on the week's last day: the report and the projection put it on that day
+    ultimo_dia = FECHA_HOY + pd.Timedelta(days=5)
+    df_total = a_ledger(pd.DataFrame({
+        'Empresa': ['BYC'], 'Banco_Limpio': ['Galicia'], 'Fecha': [ultimo_dia + pd.Timedelta(hours=10)],
+        'Importe': [25.0], 'Detalle': ['Pago'], 'Numero_Cheque': ['1'],
+    }), 'Cheques')
+    df_saldos_clean = pd.DataFrame({
+        'Empresa': pd.Categorical(['BYC']), 'Banco_Limpio': pd.Categorical(['Galicia']),
+        'Saldo FCI': [0.0], 'Saldo Banco': [100.0],
+    }).set_index(['Empresa', 'Banco_Limpio'])
+
+    assert df_total['Fecha'].tolist() == [ultimo_dia]
+    reporte = construir_reporte(df_total, df_saldos_clean, FECHA_HOY)
+    columna_dia = columnas_buckets(FECHA_HOY)[-2]
+    assert reporte[columna_dia].tolist() == [25.0]
+    assert reporte['Emitidos'].tolist() == [0.0]
+
+    proyeccion = proyectar(df_total, df_saldos_clean, FECHA_HOY, Horizonte(dias=7, dias_diarios=7, semanas=0))
+    assert proyeccion.saldos_diarios[ultimo_dia].tolist() == [75.0]
+    assert proyeccion.saldos_diarios[ultimo_dia - pd.Timedelta(days=1)].tolist() == [100.0]
+
+
+def _libro(tmp_path, filas):
+    # First sheet of a new workbook, one list per row (None leaves the cell empty)
+    wb = Workbook()
+    for fila in filas:
+        wb.active.append(fila)
+    ruta = tmp_path / 'libro.xlsx'
+    wb.save(ruta)
+    return ruta
+
+
+def _leer_pandas(ruta, columnas):
+    # What the parsers did before streaming: the whole sheet, then the positions
+    df = pd.read_excel(ruta).iloc[:, columnas]
+    df.columns = columnas
+    return df
+
+
+FILAS = [
+    ['Banco', 'Fecha', 'Importe', 'Detalle', 'Marca'],
+    ['Galicia', datetime.datetime(2026, 10, 19), 10.5, 'Pago', None],
+    [None, None, None, None, None],
+    ['Nacion', datetime.datetime(2026, 10, 20), 'NA', 'N/A', 'x'],
+    ['#N/A', None, 3, 'null', ''],
+    [None, None, None, None, None],
+    ['Santander', datetime.datetime(2026, 10, 21), 7, '', None],
+    [None, None, None, None, None],
+    [None, None, None, None, None],
+]
+
+
+@pytest.mark.parametrize('columnas', [[0, 1, 2, 3, 4], [0, 2], [3, 1]])
+def test_leer_columnas_excel_como_read_excel(tmp_path, columnas):
+    # Blank rows inside the data are kept and trailing ones dropped; NA tokens read as missing
+    ruta = _libro(tmp_path, FILAS)
+    pd.testing.assert_frame_equal(leer_columnas_excel(ruta, columnas), _leer_pandas(ruta, columnas))
+
+
+def test_leer_columnas_excel_fila_mas_ancha_que_el_encabezado(tmp_path):
+    ruta = _libro(tmp_path, [['Banco', 'Fecha'], ['Galicia', None, 5], ['Nacion', None, None]])
+    pd.testing.assert_frame_equal(leer_columnas_excel(ruta, [0, 2]), _leer_pandas(ruta, [0, 2]))
+
+
+def test_leer_columnas_excel_hoja_angosta(tmp_path):
+    ruta = _libro(tmp_path, [['Banco', 'Fecha'], ['Galicia', datetime.datetime(2026, 10, 19)]])
+    with pytest.raises(IndexError):
+        _leer_pandas(ruta, [0, 3])
+    with pytest.raises(IndexError):
+        leer_columnas_excel(ruta, [0, 3])
+
+
+def test_leer_columnas_excel_filtro_y_texto(tmp_path):
+    ruta = _libro(tmp_path, [['Cheque', 'Importe'], [123, 1], [None, 2], [456, 3]])
+    df = leer_columnas_excel(ruta, [0, 1], filtro=lambda fila: fila[1] != 2, texto=[0])
+    assert df[0].tolist() == [123, 456]
+    assert df[1].tolist() == [1, 3]
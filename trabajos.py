@@ -0,0 +1,83 @@
+"""Background jobs, so a report is generated off the Streamlit script thread.
+
+A Trabajo runs on a thread pool shared by the whole server process: several sessions
+generate reports at the same time without blocking each other, and the rerun of app.py
+that follows every widget click does not throw the work away, because the Trabajo is kept
+in ``st.session_state`` and the script only polls it. Threads are enough here: the heavy
+parsing already goes to the ingestion process pool.
+
+Progress is read from the job's Instrumentacion (finished stages out of the expected ones)
+and cancelling sets its flag, so the job stops with instrumentacion.Cancelado at the next
+stage boundary.
+"""
+
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from instrumentacion import Cancelado
+
+# Jobs running at once in the server process; later ones wait in the queue
+MAX_TRABAJOS = 4
+
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
+
+
+def _get_ejecutor():
+    global _ejecutor
+    with _ejecutor_lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=MAX_TRABAJOS, thread_name_prefix='cashflow-trabajo')
+        return _ejecutor
+
+
+class Trabajo:
+    """Runs ``funcion(instrumentacion)`` in the background.
+
+    ``etapas`` are the stage names the job is expected to record, used for ``progreso``;
+    ``clave`` identifies what the job computes, so a caller can tell whether it is still
+    the job it needs.
+    """
+
+    def __init__(self, funcion, instrumentacion, etapas, clave=None):
+        self.instrumentacion = instrumentacion
+        self.etapas = tuple(etapas)
+        self.clave = clave
+        self._futuro = _get_ejecutor().submit(funcion, instrumentacion)
+
+    @property
+    def terminado(self):
+        return self._futuro.done()
+
+    @property
+    def estado(self):
+        # 'en cola', 'en curso', 'listo', 'cancelado' or 'error'
+        if not self._futuro.done():
+            return 'en curso' if self._futuro.running() else 'en cola'
+        if self._futuro.cancelled() or isinstance(self._futuro.exception(), Cancelado):
+            return 'cancelado'
+        return 'error' if self._futuro.exception() is not None else 'listo'
+
+    @property
+    def progreso(self):
+        # Share of the expected stages already recorded (1.0 once the job is done)
+        if self._futuro.done() or not self.etapas:
+            return 1.0
+        hechas = {etapa.nombre for etapa in list(self.instrumentacion.etapas)}
+        return sum(nombre in hechas for nombre in self.etapas) / len(self.etapas)
+
+    @property
+    def etapa_actual(self):
+        return self.instrumentacion.en_curso
+
+    def cancelar(self):
+        # A job still in the queue never starts; a running one stops at its next stage
+        self.instrumentacion.cancelar()
+        self._futuro.cancel()
+
+    def resultado(self, timeout=None):
+        """The value returned by ``funcion``; raises its exception, or Cancelado if it was cancelled."""
+        try:
+            return self._futuro.result(timeout)
+        except CancelledError:
+            raise Cancelado(f"Ejecución {self.instrumentacion.corrida} cancelada") from None